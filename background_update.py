@@ -0,0 +1,83 @@
+import copy
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+
+from multi_target import target_head
+
+
+def snapshot(feats):
+    # rows of a feature window copied out, so the tracker can keep appending to its memory
+    return feats[torch.arange(feats.size(0))]
+
+
+class BackgroundUpdater():
+    # online updates on a shadow copy of the model in a worker thread (opts['background_update']).
+    # tracking keeps scoring with the current weights; poll() swaps the trained weights in between frames
+    def __init__(self, opts):
+        self.opts = opts
+        self.enabled = False
+        self.executor = None
+        self.future = None
+
+    def reset(self, model, optimizer, criterion, train_fn, on_swap):
+        # train_fn(model, criterion, optimizer, pos_feats, neg_feats, maxiter) trains the shadow,
+        # on_swap() is called after new weights were swapped in
+        self.close()
+        self.enabled = self.opts.get('background_update', False)
+        self.model = model
+        self.optimizer = optimizer
+        self.criterion = criterion
+        self.train_fn = train_fn
+        self.on_swap = on_swap
+        self.submitted = 0
+        self.swapped = 0
+        self.skipped = 0
+        if self.enabled:
+            self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def run(self, shadow, optimizer, pos_feats, neg_feats, maxiter):
+        self.train_fn(shadow, self.criterion, optimizer, pos_feats, neg_feats, maxiter)
+        return shadow, optimizer
+
+    def submit(self, pos_feats, neg_feats, maxiter):
+        # one update at a time: while one is training, further updates are dropped
+        if self.future is not None and not self.future.done():
+            self.skipped += 1
+            return False
+        self.poll()
+
+        # the shadow copies fc4-fc6 only and shares the conv layers, unless those are fine-tuned too;
+        # the optimizer and its state are copied onto the shadow's parameters
+        if any(p.requires_grad for p in self.model.layers[:3].parameters()):
+            shadow = copy.deepcopy(self.model)
+        else:
+            shadow = target_head(self.model)
+        params = {id(param): copied for param, copied in zip(self.model.parameters(), shadow.parameters())}
+        optimizer = copy.deepcopy(self.optimizer, params)
+        self.future = self.executor.submit(self.run, shadow, optimizer,
+                                           snapshot(pos_feats), snapshot(neg_feats), maxiter)
+        self.submitted += 1
+        return True
+
+    def poll(self):
+        if self.future is None or not self.future.done():
+            return False
+        shadow, optimizer = self.future.result()
+        self.future = None
+
+        with torch.no_grad():
+            for param, trained in zip(self.model.parameters(), shadow.parameters()):
+                if trained.requires_grad:
+                    param.copy_(trained)
+        self.optimizer.load_state_dict(optimizer.state_dict())
+        self.swapped += 1
+        self.on_swap()
+        return True
+
+    def close(self):
+        # an update still training is finished but not applied
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        self.future = None
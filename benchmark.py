@@ -0,0 +1,200 @@
+import numpy as np
+import os
+import sys
+import time
+import argparse
+import importlib
+import json
+from PIL import Image
+
+import torch
+
+sys.path.insert(0, '.')
+from modules.model import MDNet0, MDNet1
+from refinement import HillClimbing, PatternSearch
+
+# target motion of each synthetic sequence; 'occlusion' hides the target for a few frames
+# so that the trackers go through their target_score < 0 branch
+sequences = ['translate', 'scale', 'occlusion']
+trackers = ['000', '002', '003']
+
+
+def texture(rng, height, width, cell):
+    # smooth random texture: coarse noise upsampled to the requested size
+    coarse = rng.randint(0, 256, (height // cell + 1, width // cell + 1, 3)).astype(np.uint8)
+    return np.array(Image.fromarray(coarse).resize((width, height), Image.BICUBIC))
+
+
+def make_sequence(path, kind, n_frames=30, size=(320, 240), seed=0):
+    # writes path/img/0001.jpg ... and path/groundtruth_rect.txt, returns (img_list, gt)
+    rng = np.random.RandomState(seed)
+    width, height = size
+    background = texture(rng, height, width, 32)
+    target = texture(rng, 96, 96, 8)
+
+    img_dir = os.path.join(path, 'img')
+    if not os.path.exists(img_dir):
+        os.makedirs(img_dir)
+
+    img_list = []
+    gt = np.zeros((n_frames, 4))
+    for i in range(n_frames):
+        t = i / max(n_frames - 1, 1)
+        scale = 1 + 0.5 * np.sin(2 * np.pi * t) if kind == 'scale' else 1.
+        w, h = 48 * scale, 40 * scale
+        cx = width / 2 + width / 4 * np.sin(2 * np.pi * t)
+        cy = height / 2 + height / 6 * np.sin(4 * np.pi * t)
+        box = np.array([cx - w / 2, cy - h / 2, w, h]).round()
+        gt[i] = box
+
+        frame = background.copy()
+        x, y, w, h = box.astype(int)
+        patch = np.array(Image.fromarray(target).resize((w, h), Image.BILINEAR))
+        frame[y:y+h, x:x+w] = patch
+
+        # occluder over the target in the middle third of the sequence
+        if kind == 'occlusion' and n_frames // 3 <= i < 2 * n_frames // 3:
+            frame[max(y-8, 0):y+h+8, max(x-8, 0):x+w+8] = 128
+
+        img_path = os.path.join(img_dir, '{:04d}.jpg'.format(i + 1))
+        Image.fromarray(frame).save(img_path, quality=95)
+        img_list.append(img_path)
+
+    np.savetxt(os.path.join(path, 'groundtruth_rect.txt'), gt, fmt='%d', delimiter=',')
+    return img_list, gt
+
+
+def make_model(tracker, tracker_id, model_path):
+    # fixture model file, or a network with the layout the tracker expects and seeded random weights
+    if model_path != '':
+        return tracker.load_model(model_path)
+    torch.manual_seed(0)
+    if tracker_id == '000':
+        return MDNet0()
+    return MDNet1()
+
+
+def run_tracker(tracker_id, seqs, args):
+    tracker = importlib.import_module('gpu_tracker' + tracker_id)
+    tracker.opts['use_gpu'] = False
+    tracker.opts['trace'] = ''
+    tracker.opts['cpu_backend'] = args.compiled
+    tracker.opts['quantize'] = args.quantize
+    tracker.opts['frame_budget'] = args.budget
+    tracker.opts['init_cache'] = args.init_cache
+    tracker.opts['background_update'] = args.background
+    tracker.opts['adaptive_update'] = args.adaptive
+    tracker.opts['refine'] = args.refine
+    tracker.opts['gate'] = args.gate
+
+    res = {}
+    for name, (img_list, gt) in seqs.items():
+        model = make_model(tracker, tracker_id, args.model)
+        np.random.seed(0)
+        torch.manual_seed(0)
+        # trace in memory only; the summary is read back from the tracer
+        tracker.tracer.start()
+        tic = time.time()
+        result, result_bb, fps, overlap = tracker.run_mdnet(img_list, gt[0], gt=gt, model=model)
+        elapsed = time.time() - tic
+        summary = tracker.tracer.summary()
+        tracker.tracer.stop()
+
+        res[name] = {'fps': fps, 'meanIOU': float(overlap.mean()), 'wall': elapsed,
+                     'spans': summary['spans'], 'counters': summary['counters'],
+                     'quantized': tracker.quantized.summary(), 'budget': tracker.budget.summary(),
+                     'updates': tracker.scheduler.summary()}
+        print('tracker{:s} {:s}: fps {:.3f}, meanIOU {:.3f}'.format(tracker_id, name, fps, res[name]['meanIOU']))
+    return res
+
+
+def smooth_score(target):
+    # synthetic fc6 scores (N, 2) peaking at target: squared center offset and log size ratio
+    center = target[:2] + target[2:] / 2
+
+    def score_fn(boxes):
+        offset = (boxes[:, :2] + boxes[:, 2:] / 2 - center) / target[2:]
+        ratio = np.log(boxes[:, 2:] / target[2:])
+        score = 5 - 20 * (offset ** 2).sum(1) - 20 * (ratio ** 2).sum(1)
+        return torch.from_numpy(np.stack([-score, score], 1).astype('float32'))
+    return score_fn
+
+
+def refine_check(n_boxes=20, seeds=5):
+    # the trackers' refinement engines on random boxes around a target: the pattern search has to
+    # end at a mean score no lower than hill climbing's minus refine_tol, with fewer boxes scored
+    res = []
+    target = np.array([100., 80., 60., 50.])
+    score_fn = smooth_score(target)
+    for seed in range(seeds):
+        rng = np.random.RandomState(seed)
+        boxes = (target + rng.randn(n_boxes, 4) * [8, 8, 5, 5]).astype('float32')
+        pattern = PatternSearch({})
+        _, hill_scores, hill_evals = HillClimbing({})(score_fn, boxes)
+        _, pattern_scores, pattern_evals = pattern(score_fn, boxes)
+        hill_score = float(hill_scores[:, 1].mean())
+        pattern_score = float(pattern_scores[:, 1].mean())
+        print('refine check {:d}: hill {:.4f} in {:d} evals, pattern {:.4f} in {:d} evals '
+              '(must be >= hill - refine_tol {:g}, fewer evals)'
+              .format(seed, hill_score, hill_evals, pattern_score, pattern_evals, pattern.tol))
+        assert pattern_score >= hill_score - pattern.tol
+        assert pattern_evals < hill_evals
+        res.append({'hill': hill_score, 'hill_evals': hill_evals,
+                    'pattern': pattern_score, 'pattern_evals': pattern_evals, 'tol': pattern.tol})
+    return res
+
+
+def main(args):
+    torch.set_num_threads(args.threads)
+    if args.refine_check:
+        return refine_check()
+
+    seqs = {}
+    for k, kind in enumerate(sequences):
+        path = os.path.join(args.data, kind)
+        seqs[kind] = make_sequence(path, kind, args.frames, seed=k)
+
+    res = {}
+    res['time'] = time.strftime('%Y-%m-%d %H:%M:%S')
+    res['torch'] = torch.__version__
+    res['threads'] = torch.get_num_threads()
+    res['frames'] = args.frames
+    res['model'] = args.model if args.model != '' else 'random'
+    res['cpu_backend'] = args.compiled
+    res['quantize'] = args.quantize
+    res['frame_budget'] = args.budget
+    res['background_update'] = args.background
+    res['adaptive_update'] = args.adaptive
+    res['refine'] = args.refine
+    res['gate'] = args.gate
+    res['trackers'] = {}
+    for tracker_id in args.tracker:
+        res['trackers']['tracker' + tracker_id] = run_tracker(tracker_id, seqs, args)
+
+    if os.path.dirname(args.output) != '' and not os.path.exists(os.path.dirname(args.output)):
+        os.makedirs(os.path.dirname(args.output))
+    json.dump(res, open(args.output, 'w'), indent=2)
+    return res
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-t', '--tracker', nargs='*', default=trackers, choices=trackers)
+    parser.add_argument('-n', '--frames', type=int, default=30)
+    parser.add_argument('-d', '--data', default=os.path.join('datasets', 'synthetic'))
+    parser.add_argument('-m', '--model', default='', help='fixture model, random weights if empty')
+    parser.add_argument('-c', '--compiled', action='store_true', help='score with the TorchScript CPU backend')
+    parser.add_argument('-q', '--quantize', action='store_true', help='int8/bf16 candidate scoring')
+    parser.add_argument('-b', '--budget', type=float, default=0, help='per-frame budget in ms')
+    parser.add_argument('-i', '--init_cache', default='', help='directory caching the first frame initialisation')
+    parser.add_argument('-u', '--background', action='store_true', help='online updates in a background thread')
+    parser.add_argument('-a', '--adaptive', action='store_true', help='adaptive online update scheduling')
+    parser.add_argument('-r', '--refine', default='hill', choices=['hill', 'pattern'], help='refinement engine')
+    parser.add_argument('-R', '--refine_check', action='store_true', help='check the pattern search against hill climbing only')
+    parser.add_argument('-g', '--gate', action='store_true', help='confidence gating of refinement and re-detection')
+    parser.add_argument('-j', '--threads', type=int, default=max(1, torch.get_num_threads()))
+    parser.add_argument('-o', '--output', default=os.path.join('results', 'benchmark.json'))
+
+    args = parser.parse_args()
+    main(args)
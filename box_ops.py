@@ -0,0 +1,29 @@
+import numpy as np
+
+# moves of one box edge by one pixel, boxes are (x, y, w, h)
+edge_moves = np.array([[1, 0, -1, 0], [-1, 0, 1, 0],
+                       [0, 1, 0, -1], [0, -1, 0, 1],
+                       [0, 0, 1, 0], [0, 0, -1, 0],
+                       [0, 0, 0, 1], [0, 0, 0, -1]], dtype='float32')
+
+
+def mean_size(boxes):
+    boxes = np.asarray(boxes)
+    return boxes[:, 2].mean(), boxes[:, 3].mean()
+
+
+def neighbours(boxes, moves=edge_moves):
+    # (N, M, 4): every box shifted by every move
+    return np.asarray(boxes)[:, None, :] + moves[None, :, :]
+
+
+def grid_boxes(left, top, width, height, n=32, div=32):
+    # n x n boxes of one size, top-left corners (n-1-2j)/div box sizes away from (left, top)
+    offsets = n - 1 - 2 * np.arange(n)
+    xs, ys = np.meshgrid(left + offsets * width / div, top + offsets * height / div, indexing='ij')
+    boxes = np.empty((n * n, 4))
+    boxes[:, 0] = xs.ravel()
+    boxes[:, 1] = ys.ravel()
+    boxes[:, 2] = width
+    boxes[:, 3] = height
+    return boxes
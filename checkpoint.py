@@ -0,0 +1,53 @@
+import os
+
+import numpy as np
+
+import torch
+
+
+def save_checkpoint(path, state):
+    # written next to the target and renamed, so a crash mid-write keeps the previous checkpoint
+    if os.path.dirname(path) != '' and not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    tmp = path + '.tmp'
+    torch.save(state, tmp)
+    os.replace(tmp, path)
+
+
+def load_checkpoint(path):
+    # the state holds pickled tracker objects (bbreg, sample generators), not only tensors
+    try:
+        return torch.load(path, map_location='cpu', weights_only=False)
+    except TypeError:
+        return torch.load(path, map_location='cpu')
+
+
+def memory_state(memory, half=False):
+    # live rows of a FeatureMemory on the cpu, optionally stored as float16
+    state = memory.state_dict()
+    if state['feats'] is not None:
+        state['feats'] = state['feats'].detach().cpu()
+        if half:
+            state['feats'] = state['feats'].half()
+    return state
+
+
+def rng_state():
+    return {'numpy': np.random.get_state(), 'torch': torch.get_rng_state()}
+
+
+def set_rng_state(state):
+    np.random.set_state(state['numpy'])
+    torch.set_rng_state(state['torch'])
+
+
+def tracker_state(i, target_bbox, model, optimizer, bbreg, generators, pos_memory, neg_memory, half=False, extra=None):
+    # everything track() needs to continue after frame i; extra holds per-frame arrays (the
+    # caller's results), of which only the rows up to frame i are stored
+    if extra is not None:
+        extra = {k: np.array(v[:i + 1]) for k, v in extra.items()}
+    return {'frame': i, 'target_bbox': target_bbox,
+            'model': model.state_dict(), 'optimizer': optimizer.state_dict(),
+            'bbreg': bbreg, 'generators': generators,
+            'pos_memory': memory_state(pos_memory, half), 'neg_memory': memory_state(neg_memory, half),
+            'rng': rng_state(), 'extra': extra}
@@ -0,0 +1,83 @@
+import copy
+
+import torch
+import torch.nn as nn
+
+from multi_target import head_modules
+
+
+def inference_context():
+    # inference_mode where this torch has it
+    if hasattr(torch, 'inference_mode'):
+        return torch.inference_mode()
+    return torch.no_grad()
+
+
+def export(module, example, channels_last=False):
+    # eval copy of module traced and frozen into a TorchScript graph
+    module = copy.deepcopy(module).eval()
+    if channels_last:
+        module = module.to(memory_format=torch.channels_last)
+        example = example.contiguous(memory_format=torch.channels_last)
+    with torch.no_grad():
+        graph = torch.jit.trace(module, example, check_trace=False)
+        graph = torch.jit.freeze(graph)
+        if hasattr(torch.jit, 'optimize_for_inference'):
+            graph = torch.jit.optimize_for_inference(graph)
+    return graph
+
+
+class CompiledBackend():
+    # TorchScript copies of the conv trunk and the fc head of an MDNet for scoring on CPU.
+    # training keeps using the eager model; call invalidate() after it changed the weights
+    def __init__(self, opts):
+        self.opts = opts
+        self.model = None
+        self.conv = None
+        self.head = None
+
+    def reset(self, model=None):
+        enabled = self.opts.get('cpu_backend', False) and not self.opts['use_gpu']
+        self.channels_last = self.opts.get('cpu_channels_last', True)
+        self.threads = self.opts.get('cpu_threads', 0)
+        self.model = model if enabled else None
+        self.conv = None
+        self.head = None
+        if self.model is not None and self.threads > 0:
+            torch.set_num_threads(self.threads)
+
+    def invalidate(self):
+        # the fc head is re-exported on the next call, the conv trunk too if it is being fine-tuned
+        self.head = None
+        if self.model is not None and any(p.requires_grad for p in self.model.layers[:3].parameters()):
+            self.conv = None
+
+    def export_conv(self, regions):
+        convs = [layer for name, layer in self.model.layers.named_children() if name.startswith('conv')]
+        self.conv = export(nn.Sequential(*convs, nn.Flatten()), regions, self.channels_last)
+
+    def export_head(self, feats):
+        self.head = export(nn.Sequential(*head_modules(self.model)), feats)
+
+    def __call__(self, model, x, in_layer='conv1', out_layer='fc6'):
+        # only the two stages the trackers score with are compiled, anything else runs eagerly
+        if model is not self.model:
+            return model(x, in_layer=in_layer, out_layer=out_layer)
+
+        if in_layer == 'conv1' and out_layer == 'conv3':
+            if self.conv is None:
+                self.export_conv(x)
+            if self.channels_last:
+                x = x.contiguous(memory_format=torch.channels_last)
+            # conv3 features are also training data, so no inference tensors here
+            with torch.no_grad():
+                return self.conv(x)
+
+        if in_layer == 'fc4' and out_layer == 'fc6':
+            if self.head is None:
+                self.export_head(x)
+            # scores are copied into the caller's output buffer, so inference tensors are fine
+            with inference_context():
+                return self.head(x)
+
+        return model(x, in_layer=in_layer, out_layer=out_layer)
@@ -0,0 +1,75 @@
+import time
+
+
+class Measure():
+    def __init__(self, budget, name, n):
+        self.budget = budget
+        self.name = name
+        self.n = n
+
+    def __enter__(self):
+        self.tic = time.time()
+        return self
+
+    def __exit__(self, *exc):
+        self.budget.record(self.name, time.time() - self.tic, self.n)
+        return False
+
+
+class FrameBudget():
+    # per-frame deadline (opts['frame_budget'] in ms, 0 = unlimited). stages ask how much of their
+    # work still fits; unit costs are running averages of what the stages measured
+    def __init__(self, opts):
+        self.opts = opts
+        self.reset()
+
+    def reset(self):
+        self.budget = self.opts.get('frame_budget', 0) / 1000.
+        # fraction of the budget kept for the fixed work after the optional stages (bbreg, data collection)
+        self.margin = self.opts.get('budget_margin', 0.1)
+        self.momentum = self.opts.get('budget_momentum', 0.8)
+        self.costs = {}
+        self.degraded = {}
+        self.frame = 0
+        self.tic = None
+
+    def start(self, i):
+        self.frame = i
+        self.tic = time.time()
+
+    def remaining(self):
+        if self.budget <= 0 or self.tic is None:
+            return float('inf')
+        return self.budget * (1 - self.margin) - (time.time() - self.tic)
+
+    def units(self, name, n):
+        # how many of n units of `name` fit into the rest of the frame; all of them until a cost is known
+        cost = self.costs.get(name, 0.)
+        if cost <= 0 or self.remaining() == float('inf'):
+            return n
+        return int(max(0, min(n, self.remaining() // cost)))
+
+    def allow(self, name):
+        return self.units(name, 1) > 0
+
+    def record(self, name, seconds, n=1):
+        if n <= 0:
+            return
+        cost = seconds / n
+        if name in self.costs:
+            cost = self.momentum * self.costs[name] + (1 - self.momentum) * cost
+        self.costs[name] = cost
+
+    def measure(self, name, n=1):
+        return Measure(self, name, n)
+
+    def degrade(self, name):
+        # remember that this frame cut `name` short
+        frames = self.degraded.setdefault(name, [])
+        if len(frames) == 0 or frames[-1] != self.frame:
+            frames.append(self.frame)
+
+    def summary(self):
+        return {'budget': self.budget * 1000.,
+                'costs': {k: v * 1000. for k, v in self.costs.items()},
+                'degraded': self.degraded}
@@ -0,0 +1,84 @@
+from collections import deque
+
+import torch
+
+
+class FeatureWindow():
+    # rows [start, start + length) of a ring buffer, read by index without copying the window
+    def __init__(self, storage, start, length):
+        self.storage = storage
+        self.start = start
+        self.length = length
+
+    def size(self, dim=0):
+        if dim == 0:
+            return self.length
+        return self.storage.size(dim)
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, idx):
+        idx = torch.as_tensor(idx, dtype=torch.long).to(self.storage.device)
+        return self.storage[(idx + self.start) % self.storage.size(0)]
+
+
+class FeatureMemory():
+    # fixed-capacity ring buffer holding the features of the last n_frames frames
+    def __init__(self, n_frames, capacity):
+        self.n_frames = n_frames
+        self.capacity = capacity
+        self.storage = None
+        self.frames = deque()
+        self.tail = 0
+        self.count = 0
+
+    def __len__(self):
+        return len(self.frames)
+
+    def append(self, feats):
+        n = feats.size(0)
+        assert n <= self.capacity
+        if self.storage is None:
+            self.storage = feats.new_empty((self.capacity,) + feats.shape[1:])
+
+        # drop the oldest frames to make room
+        while len(self.frames) >= self.n_frames or self.count + n > self.capacity:
+            _, length = self.frames.popleft()
+            self.count -= length
+
+        start = self.tail
+        end = start + n
+        if end <= self.capacity:
+            self.storage[start:end] = feats
+        else:
+            split = self.capacity - start
+            self.storage[start:] = feats[:split]
+            self.storage[:n - split] = feats[split:]
+
+        self.tail = end % self.capacity
+        self.frames.append((start, n))
+        self.count += n
+
+    def window(self, n_frames=None):
+        # features of the last n_frames frames (all stored frames by default)
+        frames = list(self.frames)
+        if n_frames is not None:
+            frames = frames[-n_frames:]
+        return FeatureWindow(self.storage, frames[0][0], sum(length for _, length in frames))
+
+    def state_dict(self):
+        # live rows only, oldest frame first
+        lengths = [length for _, length in self.frames]
+        feats = self.window()[torch.arange(self.count)] if self.count > 0 else None
+        return {'lengths': lengths, 'feats': feats}
+
+    def load_state_dict(self, state, device='cpu', dtype=torch.float32):
+        self.storage = None
+        self.frames = deque()
+        self.tail = 0
+        self.count = 0
+        start = 0
+        for length in state['lengths']:
+            self.append(state['feats'][start:start + length].to(device=device, dtype=dtype))
+            start += length
@@ -0,0 +1,77 @@
+import multiprocessing as mp
+import queue
+
+import numpy as np
+from PIL import Image
+
+
+def write_frames(frames, dpi):
+    # worker process: draw the boxes on each frame and save it, until None arrives
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    fig = None
+    while True:
+        item = frames.get()
+        if item is None:
+            break
+        path, frame, gt_bbox, result_bbox = item
+        image = Image.open(frame).convert('RGB') if isinstance(frame, str) else frame
+
+        if fig is None:
+            figsize = (image.size[0] / dpi, image.size[1] / dpi)
+            fig = plt.figure(frameon=False, figsize=figsize, dpi=dpi)
+            ax = plt.Axes(fig, [0., 0., 1., 1.])
+            ax.set_axis_off()
+            fig.add_axes(ax)
+            im = ax.imshow(image, aspect='auto')
+            gt_rect = plt.Rectangle((0, 0), 0, 0, linewidth=3, edgecolor="#00ff00", zorder=1, fill=False)
+            ax.add_patch(gt_rect)
+            rect = plt.Rectangle((0, 0), 0, 0, linewidth=3, edgecolor="#ff0000", zorder=1, fill=False)
+            ax.add_patch(rect)
+
+        im.set_data(image)
+
+        gt_rect.set_visible(gt_bbox is not None)
+        if gt_bbox is not None:
+            gt_rect.set_xy(gt_bbox[:2])
+            gt_rect.set_width(gt_bbox[2])
+            gt_rect.set_height(gt_bbox[3])
+
+        rect.set_xy(result_bbox[:2])
+        rect.set_width(result_bbox[2])
+        rect.set_height(result_bbox[3])
+
+        fig.savefig(path, dpi=dpi)
+
+    plt.close('all')
+
+
+class AsyncFigureWriter():
+    # hands frames and boxes to a separate process that renders and writes them
+    def __init__(self, dpi=80.0, maxsize=32, block=False):
+        self.block = block
+        self.dropped = 0
+        ctx = mp.get_context('spawn')
+        self.frames = ctx.Queue(maxsize)
+        self.process = ctx.Process(target=write_frames, args=(self.frames, dpi), daemon=True)
+        self.process.start()
+
+    def put(self, path, frame, gt_bbox, result_bbox):
+        # frame is an image path (reopened by the worker) or an image
+        if gt_bbox is not None:
+            gt_bbox = np.array(gt_bbox)
+        item = (path, frame, gt_bbox, np.array(result_bbox))
+        try:
+            # block=True applies backpressure, otherwise a full queue drops the frame
+            self.frames.put(item, block=self.block)
+        except queue.Full:
+            self.dropped += 1
+            print('savefig queue full, dropped {:s}'.format(path))
+
+    def close(self):
+        self.frames.put(None)
+        self.process.join()
+        if self.dropped > 0:
+            print('savefig dropped {:d} frames'.format(self.dropped))
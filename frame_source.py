@@ -0,0 +1,66 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+
+def load_frame(path):
+    return Image.open(path).convert('RGB')
+
+
+def to_image(frame):
+    # image path, decoded array (HxWx3, RGB) or PIL image
+    if isinstance(frame, str):
+        return load_frame(frame)
+    if isinstance(frame, Image.Image):
+        return frame.convert('RGB')
+    return Image.fromarray(np.asarray(frame, dtype=np.uint8)).convert('RGB')
+
+
+def video_frames(path):
+    # frames of a video file, device or pipe readable by OpenCV, as RGB arrays
+    import cv2
+    capture = cv2.VideoCapture(path)
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            yield cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    finally:
+        capture.release()
+
+
+class FrameStream():
+    # iterator over decoded frames of any frame iterable; at most `depth` frames are
+    # taken from the source and decoded ahead, so memory does not grow with the sequence
+    def __init__(self, source, depth=4, workers=2):
+        self.source = iter(source)
+        self.depth = depth
+        self.executor = ThreadPoolExecutor(max_workers=workers) if depth > 0 else None
+        self.pending = deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.executor is None:
+            return to_image(next(self.source))
+
+        while len(self.pending) < self.depth + 1:
+            frame = next(self.source, None)
+            if frame is None:
+                break
+            self.pending.append(self.executor.submit(to_image, frame))
+
+        if len(self.pending) == 0:
+            raise StopIteration
+        return self.pending.popleft().result()
+
+    def close(self):
+        if self.executor is not None:
+            for future in self.pending:
+                future.cancel()
+            self.pending.clear()
+            self.executor.shutdown(wait=False)
@@ -0,0 +1,69 @@
+from collections import deque
+
+import numpy as np
+
+
+class ConfidenceGate():
+    # decides per frame whether refinement and re-detection run in full, shortened or not at all
+    # (opts['gate']). a frame is easy when its top 5 mean and its margin over the median candidate
+    # are high and the last gate_window frames were confident with little target motion
+    def __init__(self, opts):
+        self.opts = opts
+        self.reset()
+
+    def reset(self):
+        opts = self.opts
+        self.enabled = opts.get('gate', False)
+        self.score = opts.get('gate_score', 5.)
+        self.short_score = opts.get('gate_short_score', 2.)
+        self.margin = opts.get('gate_margin', 5.)
+        self.window = opts.get('gate_window', 5)
+        self.motion = opts.get('gate_motion', 0.1)
+        self.short_steps = opts.get('gate_short_steps', 2)
+        # 0 would mean no step limit to the refinement engines
+        assert self.short_steps >= 1
+        self.dip = opts.get('gate_redetect_dip', 1.)
+        self.history = deque(maxlen=self.window)
+        self.counts = {}
+
+    def count(self, name):
+        self.counts[name] = self.counts.get(name, 0) + 1
+        return name
+
+    def stable(self):
+        # the recent frames were all confident and the target moved less than gate_motion of its size
+        if len(self.history) < self.window:
+            return False
+        scores = np.array([score for score, _ in self.history])
+        boxes = np.array([bbox for _, bbox in self.history])
+        centers = boxes[:, :2] + boxes[:, 2:] / 2
+        motion = np.abs(np.diff(centers, axis=0)) / boxes[1:, 2:]
+        return scores.min() >= self.score and (len(motion) == 0 or motion.max() <= self.motion)
+
+    def refinement(self, top_scores, scores):
+        # 'refine_skip', 'refine_short' (gate_short_steps steps) or 'refine_full'
+        # for the refinement of the top 5 samples
+        if not self.enabled:
+            return self.count('refine_full')
+        score = float(top_scores.mean())
+        margin = score - float(scores.median())
+        if score >= self.score and margin >= self.margin and self.stable():
+            return self.count('refine_skip')
+        if score >= self.short_score:
+            return self.count('refine_short')
+        return self.count('refine_full')
+
+    def redetection(self, target_score):
+        # 'redetect_skip', 'redetect_short' (one round) or 'redetect_full' for a frame whose
+        # top 5 mean is negative; shallow dips after a stable stretch are left to the short term update
+        if not self.enabled:
+            return self.count('redetect_full')
+        depth = -float(target_score)
+        if self.stable() and depth <= self.dip:
+            return self.count('redetect_skip')
+        if depth <= 2 * self.dip:
+            return self.count('redetect_short')
+        return self.count('redetect_full')
+
+    def observe(self, target_score, target_bbox):
+        self.history.append((float(target_score), np.array(target_bbox, dtype='float64')))
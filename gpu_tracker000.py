@@ -2,9 +2,10 @@ import numpy as np
 import os
 import sys
 import time
+import itertools
+import functools
 import argparse
 import yaml, json
-from PIL import Image
 
 import matplotlib.pyplot as plt
 
@@ -17,81 +18,114 @@ from modules.model import MDNet0, MDNet1, BCELoss, set_optimizer
 from modules.sample_generator import SampleGenerator
 from modules.utils import overlap_ratio
 from data_prov import RegionExtractor
+from roi_features import RoIFeatureExtractor
+from workspace import Workspace
+from train_ops import index_schedule
+from feature_memory import FeatureMemory
+from frame_source import FrameStream
+from figure_writer import AsyncFigureWriter
+from tracing import Tracer
+from cpu_backend import CompiledBackend
+from quantized import QuantizedScorer
+from deadline import FrameBudget
+from checkpoint import save_checkpoint, load_checkpoint, tracker_state, set_rng_state
+from init_cache import InitCache
+from background_update import BackgroundUpdater
+from update_scheduler import UpdateScheduler
+from multi_target import BatchedHeads, SharedMaps, TargetState, target_head
 from bbreg import BBRegressor
 from gen_config import gen_config
 
 opts = yaml.safe_load(open('tracking/options.yaml','r'))
+roi_extractor = RoIFeatureExtractor(opts)
+workspace = Workspace()
+tracer = Tracer()
+compiled = CompiledBackend(opts)
+quantized = QuantizedScorer(opts)
+budget = FrameBudget(opts)
+init_cache = InitCache(opts)
+updater = BackgroundUpdater(opts)
+scheduler = UpdateScheduler(opts)
+
+
+def forward_samples(model, image, samples, out_layer='conv3', reuse=False):
+    model.eval()
+    tracer.count('forward_samples')
+    if out_layer == 'fc6':
+        tracer.count('boxes_scored', len(samples))
 
+    # shared conv3 map for the frame, features of each box pooled with ROI-align
+    if opts.get('roi_pooling', False):
+        with tracer.span('roi'):
+            return roi_extractor(model, image, samples, out_layer=out_layer)
 
-def forward_samples(model, image, samples, out_layer='conv3'):
-    model.eval()
+    # output is allocated once from the sample count; with reuse=True it is the layer's
+    # workspace buffer, which stays valid only until the next reusing call for that layer
     extractor = RegionExtractor(image, samples, opts)
-    for i, regions in enumerate(extractor):
+    pointer = 0
+    for i, regions in enumerate(tracer.iterate('region', extractor)):
         if opts['use_gpu']:
             regions = regions.cuda()
         with torch.no_grad():
-            feat = model(regions, out_layer=out_layer)
+            # candidate scores only need their ranking, opts['quantize'] scores them in reduced precision
+            if out_layer == 'fc6' and quantized.active(model):
+                with tracer.span('quantized'):
+                    feat = quantized(model, regions)
+            else:
+                with tracer.span('conv'):
+                    feat = compiled(model, regions, out_layer='conv3')
+                if out_layer != 'conv3':
+                    with tracer.span('fc'):
+                        feat = compiled(model, feat, in_layer='fc4', out_layer=out_layer)
         if i==0:
-            feats = feat.detach().clone()
-        else:
-            feats = torch.cat((feats, feat.detach().clone()), 0)
+            if reuse:
+                feats = workspace.get(out_layer, len(samples), feat)
+            else:
+                feats = feat.new_empty((len(samples),) + feat.shape[1:])
+        feats[pointer:pointer + feat.size(0)] = feat.detach()
+        pointer += feat.size(0)
     return feats
 
 
-def train(model, criterion, optimizer, pos_feats, neg_feats, maxiter, in_layer='fc4'):
+def model_updated():
+    # scores and copies of the model made before an update are stale
+    compiled.invalidate()
+    quantized.invalidate()
+
+
+def train(model, criterion, optimizer, pos_feats, neg_feats, maxiter, in_layer='fc4', invalidate=True):
     model.train()
+    # a background update trains a shadow model, its caches are invalidated at the swap
+    if invalidate:
+        model_updated()
 
     batch_pos = opts['batch_pos']
     batch_neg = opts['batch_neg']
-    batch_test = opts['batch_test']
     batch_neg_cand = max(opts['batch_neg_cand'], batch_neg)
 
-    pos_idx = np.random.permutation(pos_feats.size(0))
-    neg_idx = np.random.permutation(neg_feats.size(0))
-    while(len(pos_idx) < batch_pos * maxiter):
-        pos_idx = np.concatenate([pos_idx, np.random.permutation(pos_feats.size(0))])
-    while(len(neg_idx) < batch_neg_cand * maxiter):
-        neg_idx = np.concatenate([neg_idx, np.random.permutation(neg_feats.size(0))])
-    pos_pointer = 0
-    neg_pointer = 0
+    # index schedules of all iterations at once
+    pos_idx = index_schedule(pos_feats.size(0), batch_pos, maxiter)
+    neg_idx = index_schedule(neg_feats.size(0), batch_neg_cand, maxiter)
 
     for i in range(maxiter):
+        batch_neg_feats = neg_feats[neg_idx[i]]
 
-        # select pos idx
-        pos_next = pos_pointer + batch_pos
-        pos_cur_idx = pos_idx[pos_pointer:pos_next]
-        pos_cur_idx = pos_feats.new(pos_cur_idx).long()
-        pos_pointer = pos_next
-
-        # select neg idx
-        neg_next = neg_pointer + batch_neg_cand
-        neg_cur_idx = neg_idx[neg_pointer:neg_next]
-        neg_cur_idx = neg_feats.new(neg_cur_idx).long()
-        neg_pointer = neg_next
-
-        # create batch
-        batch_pos_feats = pos_feats[pos_cur_idx]
-        batch_neg_feats = neg_feats[neg_cur_idx]
-
-        # hard negative mining
+        # hard negative mining: all candidates scored in one pass
         if batch_neg_cand > batch_neg:
             model.eval()
-            for start in range(0, batch_neg_cand, batch_test):
-                end = min(start + batch_test, batch_neg_cand)
-                with torch.no_grad():
-                    score = model(batch_neg_feats[start:end], in_layer=in_layer)
-                if start==0:
-                    neg_cand_score = score.detach()[:, 1].clone()
-                else:
-                    neg_cand_score = torch.cat((neg_cand_score, score.detach()[:, 1].clone()), 0)
-
+            with torch.no_grad():
+                neg_cand_score = model(batch_neg_feats, in_layer=in_layer)[:, 1]
+            model.train()
             _, top_idx = neg_cand_score.topk(batch_neg)
             batch_neg_feats = batch_neg_feats[top_idx]
-            model.train()
 
-        # forward
-        pos_score = model(batch_pos_feats, in_layer=in_layer)
-        neg_score = model(batch_neg_feats, in_layer=in_layer)
+        # pos and neg in one forward
+        batch_feats = workspace.get('train_batch', batch_pos + batch_neg_feats.size(0), batch_neg_feats)
+        batch_feats[:batch_pos] = pos_feats[pos_idx[i]]
+        batch_feats[batch_pos:] = batch_neg_feats
+        score = model(batch_feats, in_layer=in_layer)
+        pos_score = score[:batch_pos]
+        neg_score = score[batch_pos:]
 
         # optimize
         loss = criterion(pos_score, neg_score)
@@ -102,30 +136,37 @@ def train(model, criterion, optimizer, pos_feats, neg_feats, maxiter, in_layer='
         optimizer.step()
 
 
-def run_mdnet(img_list, init_bbox, gt=None, savefig_dir='', display=False, model_path='models/model000.pth'):
+def load_model(model_path):
+    assert(model_path == 'models/model000.pth' or model_path == 'models/model001.pth')
+
+    if model_path == 'models/model000.pth': return MDNet0(model_path)
+    else: return MDNet1(model_path)
+
+
+def track(frames, init_bbox, model_path='models/model000.pth', model=None, resume=None, extra=None):
+    # generator over any iterable of frames (image paths, RGB arrays or PIL images), yields
+    # (i, image, target_bbox, bbreg_bbox, target_score, spf) as soon as frame i is tracked.
+    # with resume (a loaded checkpoint) the frames continue after the checkpointed frame;
+    # extra (per-frame arrays) is stored up to the frame in the checkpoints written every
+    # opts['checkpoint_interval'] frames, with float16 features unless opts['checkpoint_half'] is False
 
     # Init bbox
     target_bbox = np.array(init_bbox)
-    result = np.zeros((len(img_list), 4))
-    result_bb = np.zeros((len(img_list), 4))
-    result[0] = target_bbox
-    result_bb[0] = target_bbox
-
-    if gt is not None:
-        overlap = np.zeros(len(img_list))
-        overlap[0] = 1
 
     # Init model
     opts['model_path'] = model_path
+    roi_extractor.reset()
+    workspace.clear()
+    if opts.get('trace', '') != '':
+        tracer.start(opts['trace'], opts.get('trace_sync', False))
     
     print('********')
     print('model:', opts['model_path'])
     print('********')
 
-    assert(model_path == 'models/model000.pth' or model_path == 'models/model001.pth')
-    
-    if model_path == 'models/model000.pth': model = MDNet0(opts['model_path'])
-    else: model = MDNet1(opts['model_path'])
+    # a preloaded model (e.g. from the batch runner) is used as is
+    if model is None:
+        model = load_model(model_path)
     
     if opts['use_gpu']:
         model = model.cuda()
@@ -133,155 +174,273 @@ def run_mdnet(img_list, init_bbox, gt=None, savefig_dir='', display=False, model
     # Init criterion and optimizer 
     criterion = BCELoss()
     model.set_learnable_params(opts['ft_layers'])
+    # TorchScript copies for CPU scoring when opts['cpu_backend'] is set
+    compiled.reset(model)
+    quantized.reset(model)
+    budget.reset()
+    scheduler.reset()
     init_optimizer = set_optimizer(model, opts['lr_init'], opts['lr_mult'])
     update_optimizer = set_optimizer(model, opts['lr_update'], opts['lr_mult'])
+    updater.reset(model, update_optimizer, criterion, functools.partial(train, invalidate=False), model_updated)
 
     tic = time.time()
-    # Load first image
-    image = Image.open(img_list[0]).convert('RGB')
-
-    # Draw pos/neg samples
-    pos_examples = SampleGenerator('gaussian', image.size, opts['trans_pos'], opts['scale_pos'])(
-                        target_bbox, opts['n_pos_init'], opts['overlap_pos_init'])
-
-    neg_examples = np.concatenate([
-                    SampleGenerator('uniform', image.size, opts['trans_neg_init'], opts['scale_neg_init'])(
-                        target_bbox, int(opts['n_neg_init'] * 0.5), opts['overlap_neg_init']),
-                    SampleGenerator('whole', image.size)(
-                        target_bbox, int(opts['n_neg_init'] * 0.5), opts['overlap_neg_init'])])
-    neg_examples = np.random.permutation(neg_examples)
-
-    # Extract pos/neg features
-    pos_feats = forward_samples(model, image, pos_examples)
-    neg_feats = forward_samples(model, image, neg_examples)
-
-    # Initial training
-    train(model, criterion, init_optimizer, pos_feats, neg_feats, opts['maxiter_init'])
-    del init_optimizer, neg_feats
-    torch.cuda.empty_cache()
-
-    # Train bbox regressor
-    bbreg_examples = SampleGenerator('uniform', image.size, opts['trans_bbreg'], opts['scale_bbreg'], opts['aspect_bbreg'])(
-                        target_bbox, opts['n_bbreg'], opts['overlap_bbreg'])
-    bbreg_feats = forward_samples(model, image, bbreg_examples)
-    bbreg = BBRegressor(image.size)
-    bbreg.train(bbreg_feats, bbreg_examples, target_bbox)
-    del bbreg_feats
-    torch.cuda.empty_cache()
+    # Load first image, later frames are decoded ahead in the background
+    frames = FrameStream(frames, opts.get('prefetch', 4))
+    # ring buffers sized for the first frame plus the update frames that follow it
+    pos_memory = FeatureMemory(opts['n_frames_long'],
+                               opts['n_pos_init'] + (opts['n_frames_long'] - 1) * opts['n_pos_update'])
+    neg_memory = FeatureMemory(opts['n_frames_short'], opts['n_frames_short'] * opts['n_neg_update'])
+
+    # the first frame initialisation is looked up in the init cache (opts['init_cache'])
+    state = resume
+    if resume is None:
+        image = next(frames)
+        init_key = init_cache.key(image, target_bbox, model)
+        state = init_cache.load(init_key)
+
+    # resume or cache hit: restore the saved state instead of the first frame initialisation
+    if state is not None:
+        start = state['frame']
+        target_bbox = state['target_bbox']
+        model.load_state_dict(state['model'])
+        update_optimizer.load_state_dict(state['optimizer'])
+        bbreg = state['bbreg']
+        sample_generator, pos_generator, neg_generator = state['generators']
+        pos_memory.load_state_dict(state['pos_memory'], 'cuda' if opts['use_gpu'] else 'cpu')
+        neg_memory.load_state_dict(state['neg_memory'], 'cuda' if opts['use_gpu'] else 'cpu')
+        set_rng_state(state['rng'])
+        compiled.invalidate()
+        quantized.invalidate()
+    else:
+        start = 0
+
+        # Draw pos/neg samples
+        pos_examples = SampleGenerator('gaussian', image.size, opts['trans_pos'], opts['scale_pos'])(
+                            target_bbox, opts['n_pos_init'], opts['overlap_pos_init'])
+
+        neg_examples = np.concatenate([
+                        SampleGenerator('uniform', image.size, opts['trans_neg_init'], opts['scale_neg_init'])(
+                            target_bbox, int(opts['n_neg_init'] * 0.5), opts['overlap_neg_init']),
+                        SampleGenerator('whole', image.size)(
+                            target_bbox, int(opts['n_neg_init'] * 0.5), opts['overlap_neg_init'])])
+        neg_examples = np.random.permutation(neg_examples)
+
+        # Extract pos/neg features
+        pos_feats = forward_samples(model, image, pos_examples)
+        neg_feats = forward_samples(model, image, neg_examples)
+
+        # Initial training
+        train(model, criterion, init_optimizer, pos_feats, neg_feats, opts['maxiter_init'])
+        del init_optimizer, neg_feats
+        torch.cuda.empty_cache()
 
-    # Init sample generators for update
-    sample_generator = SampleGenerator('gaussian', image.size, opts['trans'], opts['scale'])
-    pos_generator = SampleGenerator('gaussian', image.size, opts['trans_pos'], opts['scale_pos'])
-    neg_generator = SampleGenerator('uniform', image.size, opts['trans_neg'], opts['scale_neg'])
+        # Train bbox regressor
+        bbreg_examples = SampleGenerator('uniform', image.size, opts['trans_bbreg'], opts['scale_bbreg'], opts['aspect_bbreg'])(
+                            target_bbox, opts['n_bbreg'], opts['overlap_bbreg'])
+        bbreg_feats = forward_samples(model, image, bbreg_examples)
+        bbreg = BBRegressor(image.size)
+        bbreg.train(bbreg_feats, bbreg_examples, target_bbox)
+        del bbreg_feats
+        torch.cuda.empty_cache()
 
-    # Init pos/neg features for update
-    neg_examples = neg_generator(target_bbox, opts['n_neg_update'], opts['overlap_neg_init'])
-    neg_feats = forward_samples(model, image, neg_examples)
-    pos_feats_all = [pos_feats]
-    neg_feats_all = [neg_feats]
+        # Init sample generators for update
+        sample_generator = SampleGenerator('gaussian', image.size, opts['trans'], opts['scale'])
+        pos_generator = SampleGenerator('gaussian', image.size, opts['trans_pos'], opts['scale_pos'])
+        neg_generator = SampleGenerator('uniform', image.size, opts['trans_neg'], opts['scale_neg'])
+
+        # Init pos/neg features for update
+        neg_examples = neg_generator(target_bbox, opts['n_neg_update'], opts['overlap_neg_init'])
+        neg_feats = forward_samples(model, image, neg_examples)
+        pos_memory.append(pos_feats)
+        neg_memory.append(neg_feats)
+        init_cache.save(init_key, tracker_state(0, target_bbox, model, update_optimizer, bbreg,
+                                                (sample_generator, pos_generator, neg_generator),
+                                                pos_memory, neg_memory))
+
+    if resume is None:
+        spf = time.time() - tic
+        tracer.end_frame(0, spf)
+
+    try:
+        if resume is None:
+            yield 0, image, target_bbox, target_bbox, None, spf
+
+        # Main loop
+        for i in itertools.count(start + 1):
+
+            tic = time.time()
+            budget.start(i)
+            # Load image
+            with tracer.span('decode'):
+                image = next(frames, None)
+            if image is None:
+                break
+
+            # weights trained in the background are swapped in between frames
+            if updater.enabled and updater.poll():
+                tracer.count('update_swaps')
+
+            # Estimate target bbox
+            with tracer.span('sampling'):
+                samples = sample_generator(target_bbox, opts['n_samples'])
+            sample_scores = forward_samples(model, image, samples, out_layer='fc6', reuse=True)
+
+            top_scores, top_idx = sample_scores[:, 1].topk(5)
+            top_idx = top_idx.cpu()
+            target_score = top_scores.mean()
+            target_bbox = samples[top_idx]
+            if top_idx.shape[0] > 1:
+                target_bbox = target_bbox.mean(axis=0)
+            success = target_score > 0
+        
+            # Expand search area at failure
+            if success:
+                sample_generator.set_trans(opts['trans'])
+            else:
+                sample_generator.expand_trans(opts['trans_limit'])
+
+            # Bbox regression
+            if success:
+                with tracer.span('bbreg'):
+                    bbreg_samples = samples[top_idx]
+                    if top_idx.shape[0] == 1:
+                        bbreg_samples = bbreg_samples[None,:]
+                    bbreg_feats = forward_samples(model, image, bbreg_samples, reuse=True)
+                    bbreg_samples = bbreg.predict(bbreg_feats, bbreg_samples)
+                    bbreg_bbox = bbreg_samples.mean(axis=0)
+            else:
+                bbreg_bbox = target_bbox
+
+            # Data collect
+            if success:
+                pos_examples = pos_generator(target_bbox, opts['n_pos_update'], opts['overlap_pos_update'])
+                pos_feats = forward_samples(model, image, pos_examples)
+                scheduler.novelty(pos_feats)
+                pos_memory.append(pos_feats)
+
+                neg_examples = neg_generator(target_bbox, opts['n_neg_update'], opts['overlap_neg_update'])
+                neg_feats = forward_samples(model, image, neg_examples)
+                neg_memory.append(neg_feats)
+
+            # update policy: on failure and every long_interval frames, or adaptive (opts['adaptive_update'])
+            n_update = scheduler.iterations(i, success, target_score, sample_scores[:, 1])
+
+            # Short term update
+            if not success:
+                pos_data = pos_memory.window(opts['n_frames_short'])
+                neg_data = neg_memory.window()
+
+            # Long term update
+            elif n_update > 0:
+                pos_data = pos_memory.window()
+                neg_data = neg_memory.window()
+
+            if n_update > 0:
+                maxiter = budget.units('train_iter', n_update)
+                if maxiter < n_update:
+                    budget.degrade('update')
+                if maxiter > 0:
+                    with tracer.span('train'):
+                        # the shadow model trains outside the frame: submitting is not a train_iter cost
+                        if updater.enabled:
+                            trained = updater.submit(pos_data, neg_data, maxiter)
+                        else:
+                            with budget.measure('train_iter', maxiter):
+                                train(model, criterion, update_optimizer, pos_data, neg_data, maxiter)
+                            trained = True
+                    # an update dropped while another one is training uses no credit
+                    if trained:
+                        tracer.count('updates')
+                        scheduler.done(i, maxiter)
+
+            torch.cuda.empty_cache()
+            spf = time.time() - tic
+            tracer.end_frame(i, spf)
+            yield i, image, target_bbox, bbreg_bbox, target_score.item(), spf
+
+            # checkpoint once the caller has taken frame i
+            if opts.get('checkpoint', '') != '' and i % opts.get('checkpoint_interval', 50) == 0:
+                with tracer.span('checkpoint'):
+                    save_checkpoint(opts['checkpoint'], tracker_state(i, target_bbox, model, update_optimizer, bbreg,
+                                                                      (sample_generator, pos_generator, neg_generator),
+                                                                      pos_memory, neg_memory,
+                                                                      opts.get('checkpoint_half', True), extra))
+    finally:
+        updater.close()
+        if updater.enabled:
+            print('background updates: {:d} submitted, {:d} swapped, {:d} skipped'
+                  .format(updater.submitted, updater.swapped, updater.skipped))
+        if scheduler.adaptive:
+            print('adaptive updates: {updates:d} updates, {iterations:d} iterations'.format(**scheduler.summary()))
+        if quantized.summary() is not None:
+            print('quantized scoring: {checks:d} checks, top-k agreement {agreement:.3f} (min {min_agreement:.3f})'.format(**quantized.summary()))
+        if budget.budget > 0:
+            print('frame budget {:.0f} ms, degraded: '.format(budget.budget * 1000.) +
+                  ', '.join('{:s} {:d} frames'.format(k, len(v)) for k, v in sorted(budget.degraded.items())))
+        frames.close()
+        if tracer.enabled:
+            tracer.report()
+            tracer.stop()
+
+
+def run_mdnet(img_list, init_bbox, gt=None, savefig_dir='', display=False, model_path='models/model000.pth', model=None, resume=''):
+    # batch wrapper over track(): collects the boxes of a whole sequence
+    result = np.zeros((len(img_list), 4))
+    result_bb = np.zeros((len(img_list), 4))
+    # no ground truth: no overlap either, returned as None
+    overlap = None
+    if gt is not None:
+        overlap = np.zeros(len(img_list))
+        overlap[0] = 1
 
-    spf_total = time.time() - tic
+    # resume from a checkpoint: results up to its frame are taken from it
+    state = None
+    start = 0
+    if resume != '':
+        state = load_checkpoint(resume)
+        start = state['frame']
+        result[:start + 1] = state['extra']['result'][:start + 1]
+        result_bb[:start + 1] = state['extra']['result_bb'][:start + 1]
+        if gt is not None:
+            overlap[1:start + 1] = overlap_ratio(gt[1:start + 1], result_bb[1:start + 1])
+        print('resumed from {:s} at frame {:d}'.format(resume, start))
 
-    # Display
+    spf_total = 0
+    n_frames = 0
     savefig = savefig_dir != ''
-    if display or savefig:
-        dpi = 80.0
-        figsize = (image.size[0] / dpi, image.size[1] / dpi)
+    fig = None
+    writer = None
+    for i, image, target_bbox, bbreg_bbox, target_score, spf in track(img_list[start + 1:] if state is not None else img_list,
+                                                                      init_bbox, model_path, model, state,
+                                                                      {'result': result, 'result_bb': result_bb}):
+        result[i] = target_bbox
+        result_bb[i] = bbreg_bbox
+        spf_total += spf
+        n_frames += 1
 
-        fig = plt.figure(frameon=False, figsize=figsize, dpi=dpi)
-        ax = plt.Axes(fig, [0., 0., 1., 1.])
-        ax.set_axis_off()
-        fig.add_axes(ax)
-        im = ax.imshow(image, aspect='auto')
+        # Display
+        if display and fig is None:
+            dpi = 80.0
+            figsize = (image.size[0] / dpi, image.size[1] / dpi)
 
-        if gt is not None:
-            gt_rect = plt.Rectangle(tuple(gt[0, :2]), gt[0, 2], gt[0, 3],
-                                    linewidth=3, edgecolor="#00ff00", zorder=1, fill=False)
-            ax.add_patch(gt_rect)
+            fig = plt.figure(frameon=False, figsize=figsize, dpi=dpi)
+            ax = plt.Axes(fig, [0., 0., 1., 1.])
+            ax.set_axis_off()
+            fig.add_axes(ax)
+            im = ax.imshow(image, aspect='auto')
 
-        rect = plt.Rectangle(tuple(result_bb[0, :2]), result_bb[0, 2], result_bb[0, 3],
-                             linewidth=3, edgecolor="#ff0000", zorder=1, fill=False)
-        ax.add_patch(rect)
+            if gt is not None:
+                gt_rect = plt.Rectangle(tuple(gt[i, :2]), gt[i, 2], gt[i, 3],
+                                        linewidth=3, edgecolor="#00ff00", zorder=1, fill=False)
+                ax.add_patch(gt_rect)
+
+            rect = plt.Rectangle(tuple(result_bb[i, :2]), result_bb[i, 2], result_bb[i, 3],
+                                 linewidth=3, edgecolor="#ff0000", zorder=1, fill=False)
+            ax.add_patch(rect)
 
-        if display:
             plt.pause(.01)
             plt.draw()
-        if savefig:
-            fig.savefig(os.path.join(savefig_dir, '0000.jpg'), dpi=dpi)
-
-    # Main loop
-    for i in range(1, len(img_list)):
-
-        tic = time.time()
-        # Load image
-        image = Image.open(img_list[i]).convert('RGB')
-
-        # Estimate target bbox
-        samples = sample_generator(target_bbox, opts['n_samples'])
-        sample_scores = forward_samples(model, image, samples, out_layer='fc6')
-
-        top_scores, top_idx = sample_scores[:, 1].topk(5)
-        top_idx = top_idx.cpu()
-        target_score = top_scores.mean()
-        target_bbox = samples[top_idx]
-        if top_idx.shape[0] > 1:
-            target_bbox = target_bbox.mean(axis=0)
-        success = target_score > 0
-        
-        # Expand search area at failure
-        if success:
-            sample_generator.set_trans(opts['trans'])
-        else:
-            sample_generator.expand_trans(opts['trans_limit'])
-
-        # Bbox regression
-        if success:
-            bbreg_samples = samples[top_idx]
-            if top_idx.shape[0] == 1:
-                bbreg_samples = bbreg_samples[None,:]
-            bbreg_feats = forward_samples(model, image, bbreg_samples)
-            bbreg_samples = bbreg.predict(bbreg_feats, bbreg_samples)
-            bbreg_bbox = bbreg_samples.mean(axis=0)
-        else:
-            bbreg_bbox = target_bbox
-
-        # Save result
-        result[i] = target_bbox
-        result_bb[i] = bbreg_bbox
-
-        # Data collect
-        if success:
-            pos_examples = pos_generator(target_bbox, opts['n_pos_update'], opts['overlap_pos_update'])
-            pos_feats = forward_samples(model, image, pos_examples)
-            pos_feats_all.append(pos_feats)
-            if len(pos_feats_all) > opts['n_frames_long']:
-                del pos_feats_all[0]
-
-            neg_examples = neg_generator(target_bbox, opts['n_neg_update'], opts['overlap_neg_update'])
-            neg_feats = forward_samples(model, image, neg_examples)
-            neg_feats_all.append(neg_feats)
-            if len(neg_feats_all) > opts['n_frames_short']:
-                del neg_feats_all[0]
-
-        # Short term update
-        if not success:
-            nframes = min(opts['n_frames_short'], len(pos_feats_all))
-            pos_data = torch.cat(pos_feats_all[-nframes:], 0)
-            neg_data = torch.cat(neg_feats_all, 0)
-            train(model, criterion, update_optimizer, pos_data, neg_data, opts['maxiter_update'])
-
-        # Long term update
-        elif i % opts['long_interval'] == 0:
-            pos_data = torch.cat(pos_feats_all, 0)
-            neg_data = torch.cat(neg_feats_all, 0)
-            train(model, criterion, update_optimizer, pos_data, neg_data, opts['maxiter_update'])
-
-        torch.cuda.empty_cache()
-        spf = time.time() - tic
-        spf_total += spf
-
-        # Display
-        if display or savefig:
+        elif display:
             im.set_data(image)
 
             if gt is not None:
@@ -293,12 +452,19 @@ def run_mdnet(img_list, init_bbox, gt=None, savefig_dir='', display=False, model
             rect.set_width(result_bb[i, 2])
             rect.set_height(result_bb[i, 3])
 
-            if display:
-                plt.pause(.01)
-                plt.draw()
-            if savefig:
-                fig.savefig(os.path.join(savefig_dir, ('M' + model_path[14] + 'T0_' + '{:04d}.jpg'.format(i))), dpi=dpi)
+            plt.pause(.01)
+            plt.draw()
 
+        # saved figures are rendered and written by a separate process
+        if savefig:
+            if writer is None:
+                writer = AsyncFigureWriter(80.0, opts.get('savefig_queue', 32), opts.get('savefig_block', False))
+            name = '0000.jpg' if i == 0 else 'M' + model_path[14] + 'T0_' + '{:04d}.jpg'.format(i)
+            writer.put(os.path.join(savefig_dir, name), img_list[i],
+                       gt[i] if gt is not None else None, result_bb[i])
+
+        if i == 0:
+            continue
         if gt is None:
             print('Frame {:d}/{:d}, Score {:.3f}, Time {:.3f}'
                 .format(i, len(img_list), target_score, spf))
@@ -309,20 +475,226 @@ def run_mdnet(img_list, init_bbox, gt=None, savefig_dir='', display=False, model
 
     if gt is not None:
         print('meanIOU: {:.3f}'.format(overlap.mean()))
-    fps = len(img_list) / spf_total
+    fps = n_frames / spf_total
+    if writer is not None:
+        writer.close()
     plt.close('all')
     return result, result_bb, fps, overlap
 
+def run_mdnet_multi(img_list, init_bboxes, gt=None, model_path='models/model000.pth', model=None):
+    # several targets in one video: each frame is decoded once and goes through the shared conv layers;
+    # every target keeps its own fc4-fc6 head, feature memory, bbreg and sample generators.
+    # gt is a list with the ground truth of each target, None for targets without one
+    n_targets = len(init_bboxes)
+    if gt is None:
+        gt = [None] * n_targets
+    result = np.zeros((n_targets, len(img_list), 4))
+    result_bb = np.zeros((n_targets, len(img_list), 4))
+    result[:, 0] = init_bboxes
+    result_bb[:, 0] = init_bboxes
+
+    overlap = [None] * n_targets
+    for k in range(n_targets):
+        if gt[k] is not None:
+            overlap[k] = np.zeros(len(img_list))
+            overlap[k][0] = 1
+
+    # Init model
+    opts['model_path'] = model_path
+    roi_extractor.reset()
+    workspace.clear()
+
+    if model is None:
+        model = load_model(model_path)
+
+    if opts['use_gpu']:
+        model = model.cuda()
+    model.set_learnable_params(opts['ft_layers'])
+    compiled.reset(model)
+    quantized.reset(model)
+
+    criterion = BCELoss()
+
+    # features of every target are pooled from conv3 maps shared per frame by targets of similar size
+    maps = SharedMaps(opts, [init_bbox[2:] for init_bbox in init_bboxes])
+
+    def features(k, image, samples):
+        return maps.pool(model, image, k, samples)
+
+    tic = time.time()
+    # Load first image, later frames are decoded ahead in the background
+    frames = FrameStream(img_list, opts.get('prefetch', 4))
+    image = next(frames)
+
+    targets = []
+    for k, init_bbox in enumerate(init_bboxes):
+        target_bbox = np.array(init_bbox)
+
+        # own copy of the fc layers for every target, the conv layers are shared
+        head = target_head(model)
+        init_optimizer = set_optimizer(head, opts['lr_init'], opts['lr_mult'])
+        update_optimizer = set_optimizer(head, opts['lr_update'], opts['lr_mult'])
+
+        # Draw pos/neg samples
+        pos_examples = SampleGenerator('gaussian', image.size, opts['trans_pos'], opts['scale_pos'])(
+                            target_bbox, opts['n_pos_init'], opts['overlap_pos_init'])
+
+        neg_examples = np.concatenate([
+                        SampleGenerator('uniform', image.size, opts['trans_neg_init'], opts['scale_neg_init'])(
+                            target_bbox, int(opts['n_neg_init'] * 0.5), opts['overlap_neg_init']),
+                        SampleGenerator('whole', image.size)(
+                            target_bbox, int(opts['n_neg_init'] * 0.5), opts['overlap_neg_init'])])
+        neg_examples = np.random.permutation(neg_examples)
+
+        # Extract pos/neg features
+        pos_feats = features(k, image, pos_examples)
+        neg_feats = features(k, image, neg_examples)
+
+        # Initial training
+        train(head, criterion, init_optimizer, pos_feats, neg_feats, opts['maxiter_init'])
+        del init_optimizer, neg_feats
+
+        # Train bbox regressor
+        bbreg_examples = SampleGenerator('uniform', image.size, opts['trans_bbreg'], opts['scale_bbreg'], opts['aspect_bbreg'])(
+                            target_bbox, opts['n_bbreg'], opts['overlap_bbreg'])
+        bbreg_feats = features(k, image, bbreg_examples)
+        bbreg = BBRegressor(image.size)
+        bbreg.train(bbreg_feats, bbreg_examples, target_bbox)
+        del bbreg_feats
+
+        # Init sample generators and pos/neg features for update
+        sample_generator = SampleGenerator('gaussian', image.size, opts['trans'], opts['scale'])
+        pos_generator = SampleGenerator('gaussian', image.size, opts['trans_pos'], opts['scale_pos'])
+        neg_generator = SampleGenerator('uniform', image.size, opts['trans_neg'], opts['scale_neg'])
+
+        neg_examples = neg_generator(target_bbox, opts['n_neg_update'], opts['overlap_neg_init'])
+        neg_feats = features(k, image, neg_examples)
+        pos_memory = FeatureMemory(opts['n_frames_long'],
+                                   opts['n_pos_init'] + (opts['n_frames_long'] - 1) * opts['n_pos_update'])
+        neg_memory = FeatureMemory(opts['n_frames_short'], opts['n_frames_short'] * opts['n_neg_update'])
+        pos_memory.append(pos_feats)
+        neg_memory.append(neg_feats)
+
+        targets.append(TargetState(head, update_optimizer, bbreg, target_bbox,
+                                   sample_generator, pos_generator, neg_generator, pos_memory, neg_memory))
+    torch.cuda.empty_cache()
+
+    heads = BatchedHeads([t.model for t in targets])
+    spf_total = time.time() - tic
+
+    # Main loop
+    for i in range(1, len(img_list)):
+
+        tic = time.time()
+        # Load image
+        image = next(frames)
+
+        # Estimate target bboxes: one conv pass per size bucket, all heads in one batched fc pass
+        samples = [t.sample_generator(t.target_bbox, opts['n_samples']) for t in targets]
+        maps.set_frame(model, image, samples)
+        feats = torch.stack([features(k, image, samples[k]) for k in range(n_targets)])
+        sample_scores = heads(feats)
+
+        target_scores = []
+        examples = []
+        for k, t in enumerate(targets):
+            top_scores, top_idx = sample_scores[k, :, 1].topk(5)
+            top_idx = top_idx.cpu()
+            target_score = top_scores.mean()
+            t.target_bbox = samples[k][top_idx].mean(axis=0)
+            success = target_score > 0
+            target_scores.append(target_score.item())
+
+            # Expand search area at failure
+            if success:
+                t.sample_generator.set_trans(opts['trans'])
+            else:
+                t.sample_generator.expand_trans(opts['trans_limit'])
+
+            # Bbox regression
+            if success:
+                bbreg_samples = samples[k][top_idx]
+                bbreg_feats = features(k, image, bbreg_samples)
+                bbreg_samples = t.bbreg.predict(bbreg_feats, bbreg_samples)
+                bbreg_bbox = bbreg_samples.mean(axis=0)
+            else:
+                bbreg_bbox = t.target_bbox
+
+            # Save result
+            result[k, i] = t.target_bbox
+            result_bb[k, i] = bbreg_bbox
+
+            # Data collect: examples are drawn for all targets first
+            if success:
+                examples.append((t.pos_generator(t.target_bbox, opts['n_pos_update'], opts['overlap_pos_update']),
+                                 t.neg_generator(t.target_bbox, opts['n_neg_update'], opts['overlap_neg_update'])))
+            else:
+                examples.append(None)
+
+            if overlap[k] is not None:
+                overlap[k][i] = overlap_ratio(gt[k][i], result_bb[k, i])[0]
+
+        # the maps grow once to cover the examples of all targets, which are then pooled from them
+        maps.cover(model, image, [np.concatenate(e) if e is not None else np.zeros((0, 4)) for e in examples])
+        for k, t in enumerate(targets):
+            if examples[k] is not None:
+                t.pos_memory.append(features(k, image, examples[k][0]))
+                t.neg_memory.append(features(k, image, examples[k][1]))
+
+            # Short term update
+            if examples[k] is None:
+                pos_data = t.pos_memory.window(opts['n_frames_short'])
+                neg_data = t.neg_memory.window()
+                train(t.model, criterion, t.update_optimizer, pos_data, neg_data, opts['maxiter_update'])
+                heads.invalidate()
+
+            # Long term update
+            elif i % opts['long_interval'] == 0:
+                pos_data = t.pos_memory.window()
+                neg_data = t.neg_memory.window()
+                train(t.model, criterion, t.update_optimizer, pos_data, neg_data, opts['maxiter_update'])
+                heads.invalidate()
+
+        torch.cuda.empty_cache()
+        spf = time.time() - tic
+        spf_total += spf
+
+        print('Frame {:d}/{:d}, Scores {:s}, Time {:.3f}'
+            .format(i, len(img_list), ' '.join('{:.3f}'.format(score) for score in target_scores), spf))
+
+    for k in range(n_targets):
+        if overlap[k] is not None:
+            print('target {:d} meanIOU: {:.3f}'.format(k, overlap[k].mean()))
+    fps = len(img_list) / spf_total
+    frames.close()
+    return result, result_bb, fps, overlap
+
 def main(args, model_path):
     print('args:', args.seq, args.json, args.savefig, args.display)
     np.random.seed(0)
     torch.manual_seed(0)
 
+    if args.trace != '':
+        opts['trace'] = args.trace
+    if args.budget > 0:
+        opts['frame_budget'] = args.budget
+    if args.checkpoint != '':
+        opts['checkpoint'] = args.checkpoint
+    if args.init_cache != '':
+        opts['init_cache'] = args.init_cache
+
     # Generate sequence config
     img_list, init_bbox, gt, savefig_dir, display, result_path = gen_config(args)
 
-    # Run tracker
-    result, result_bb, fps, overlap = run_mdnet(img_list, init_bbox, gt=gt, savefig_dir=savefig_dir, display=display, model_path=model_path)
+    # Run tracker; -M adds targets to the one of the sequence config, which alone has ground truth
+    if len(args.multi) > 0:
+        init_bboxes = [init_bbox] + [[float(v) for v in box.split(',')] for box in args.multi]
+        result, result_bb, fps, overlaps = run_mdnet_multi(img_list, init_bboxes, gt=[gt] + [None] * len(args.multi),
+                                                           model_path=model_path)
+        overlap = overlaps[0]
+    else:
+        result, result_bb, fps, overlap = run_mdnet(img_list, init_bbox, gt=gt, savefig_dir=savefig_dir, display=display, model_path=model_path,
+                                                    resume=args.resume)
 
     # Save result
     res = {}
@@ -341,6 +713,12 @@ if __name__ == "__main__":
     parser.add_argument('-f', '--savefig', action='store_true')
     parser.add_argument('-d', '--display', action='store_true')
     parser.add_argument('-m', '--model', default='model.pth')
+    parser.add_argument('-t', '--trace', default='', help='per-frame JSONL trace')
+    parser.add_argument('-b', '--budget', type=float, default=0, help='per-frame budget in ms')
+    parser.add_argument('-c', '--checkpoint', default='', help='tracker state written every checkpoint_interval frames')
+    parser.add_argument('-r', '--resume', default='', help='checkpoint to resume from')
+    parser.add_argument('-i', '--init_cache', default='', help='directory caching the first frame initialisation')
+    parser.add_argument('-M', '--multi', nargs='*', default=[], help='init boxes x,y,w,h of further targets')
 
     args = parser.parse_args()
     assert args.seq != '' or args.json != ''
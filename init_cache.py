@@ -0,0 +1,62 @@
+import hashlib
+import json
+import os
+import pickle
+
+import numpy as np
+
+import torch
+
+from checkpoint import save_checkpoint, load_checkpoint
+
+# options that change the result of the first frame initialisation, including the ones
+# whose effect is restored from the cache (sample generators, update optimizer)
+init_opts = ['img_size', 'padding', 'batch_test', 'batch_pos', 'batch_neg', 'batch_neg_cand',
+             'n_pos_init', 'overlap_pos_init', 'trans_pos', 'scale_pos',
+             'n_neg_init', 'overlap_neg_init', 'trans_neg_init', 'scale_neg_init',
+             'n_neg_update', 'trans_neg', 'scale_neg', 'trans', 'scale',
+             'n_bbreg', 'overlap_bbreg', 'trans_bbreg', 'scale_bbreg', 'aspect_bbreg',
+             'maxiter_init', 'lr_init', 'lr_update', 'lr_mult', 'grad_clip', 'ft_layers', 'use_gpu',
+             'roi_pooling', 'cpu_backend', 'cpu_channels_last']
+
+
+class InitCache():
+    # first frame initialisation (trained model, bbreg, feature memory) stored in opts['init_cache'],
+    # keyed by the frame content, init bbox, model weights, init options and RNG state
+    def __init__(self, opts):
+        self.opts = opts
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, image, init_bbox, model):
+        if self.opts.get('init_cache', '') == '':
+            return None
+        h = hashlib.sha1()
+        h.update(json.dumps([image.size, image.mode]).encode())
+        h.update(image.tobytes())
+        h.update(np.asarray(init_bbox, dtype='float64').tobytes())
+        for name, value in model.state_dict().items():
+            h.update(name.encode())
+            h.update(value.detach().cpu().numpy().tobytes())
+        h.update(json.dumps({k: self.opts.get(k) for k in init_opts}, sort_keys=True, default=str).encode())
+        # sample drawing and training are random; seeded runs hit, unseeded ones do not
+        # the whole numpy state: key array, position and cached gaussian
+        h.update(pickle.dumps(np.random.get_state()))
+        h.update(torch.get_rng_state().numpy().tobytes())
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.opts['init_cache'], key + '.pth')
+
+    def load(self, key):
+        if key is None:
+            return None
+        if not os.path.exists(self.path(key)):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return load_checkpoint(self.path(key))
+
+    def save(self, key, state):
+        if key is not None:
+            save_checkpoint(self.path(key), state)
@@ -0,0 +1,113 @@
+import copy
+
+import numpy as np
+
+import torch
+import torch.nn as nn
+
+from roi_features import RoIFeatureExtractor
+
+
+def head_modules(model):
+    # modules of fc4-fc6 in forward order
+    modules = []
+    for name, layer in model.layers.named_children():
+        if name.startswith('fc'):
+            modules += list(layer)
+    return modules + list(model.branches[0])
+
+
+def target_head(model):
+    # copy of model for one target: the conv layers stay shared with model, only fc4-fc6 are copied
+    shared = {id(layer): layer for name, layer in model.layers.named_children() if not name.startswith('fc')}
+    return copy.deepcopy(model, shared)
+
+
+class BatchedHeads():
+    # fc heads of several targets evaluated together, one batched matmul per fc layer
+    def __init__(self, models):
+        self.models = models
+        self.layers = None
+
+    def invalidate(self):
+        # call after training any of the heads
+        self.layers = None
+
+    def stack(self):
+        self.layers = []
+        for modules in zip(*[head_modules(model) for model in self.models]):
+            if isinstance(modules[0], nn.Linear):
+                weight = torch.stack([m.weight.detach() for m in modules]).transpose(1, 2)
+                bias = torch.stack([m.bias.detach() for m in modules]).unsqueeze(1)
+                self.layers.append((weight, bias))
+            else:
+                # parameter-free modules (ReLU, Dropout in eval mode) are shared
+                self.layers.append(modules[0])
+
+    def __call__(self, feats):
+        # feats: (n_targets, n_samples, conv3 dim), row block k is scored by the head of target k
+        if self.layers is None:
+            self.stack()
+        x = feats
+        with torch.no_grad():
+            for layer in self.layers:
+                if isinstance(layer, tuple):
+                    x = torch.baddbmm(layer[1], x, layer[0])
+                else:
+                    layer.eval()
+                    x = layer(x)
+        return x
+
+
+class TargetState():
+    # everything one target owns: fc head, optimizer, feature memory, bbreg and samplers
+    def __init__(self, model, update_optimizer, bbreg, target_bbox,
+                 sample_generator, pos_generator, neg_generator, pos_memory, neg_memory):
+        self.model = model
+        self.update_optimizer = update_optimizer
+        self.bbreg = bbreg
+        self.target_bbox = target_bbox
+        self.sample_generator = sample_generator
+        self.pos_generator = pos_generator
+        self.neg_generator = neg_generator
+        self.pos_memory = pos_memory
+        self.neg_memory = neg_memory
+
+
+class SharedMaps():
+    # conv3 maps shared by several targets: targets whose sizes are within opts['multi_scale_ratio']
+    # of a bucket's first target use that bucket's map, so each frame runs the conv layers once
+    # per size bucket and every target pools its boxes with ROI-align
+    def __init__(self, opts, sizes):
+        ratio = opts.get('multi_scale_ratio', 1.5)
+        self.bucket = []
+        refs = []
+        for w, h in sizes:
+            for b, (ref_w, ref_h) in enumerate(refs):
+                if max(w / ref_w, ref_w / w, h / ref_h, ref_h / h) <= ratio:
+                    self.bucket.append(b)
+                    break
+            else:
+                self.bucket.append(len(refs))
+                refs.append((w, h))
+        self.extractors = [RoIFeatureExtractor(opts) for _ in refs]
+
+    def bucket_boxes(self, samples, b):
+        return np.concatenate([np.asarray(boxes).reshape(-1, 4) for boxes, k in zip(samples, self.bucket) if k == b])
+
+    def set_frame(self, model, image, samples):
+        # samples[k]: candidate boxes of target k; one map per bucket covering all of its targets' boxes
+        for b, extractor in enumerate(self.extractors):
+            boxes = self.bucket_boxes(samples, b)
+            extractor.set_frame(image, boxes)
+            extractor.ensure(model, image, boxes)
+
+    def cover(self, model, image, samples):
+        # grow each bucket's map once to cover samples[k] of all its targets (e.g. far negatives)
+        for b, extractor in enumerate(self.extractors):
+            boxes = self.bucket_boxes(samples, b)
+            if len(boxes) > 0:
+                extractor.ensure(model, image, boxes)
+
+    def pool(self, model, image, k, samples):
+        return self.extractors[self.bucket[k]].pool(model, image, samples)
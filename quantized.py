@@ -0,0 +1,94 @@
+import copy
+
+import numpy as np
+
+import torch
+import torch.nn as nn
+
+from multi_target import head_modules
+
+
+def bf16_supported():
+    # bf16 convolutions on CPU need a torch with CPU autocast and oneDNN, and a CPU with native
+    # bf16 (avx512_bf16 / amx); oneDNN emulates it otherwise, which is slower than fp32
+    if not hasattr(torch, 'autocast') or not torch.backends.mkldnn.is_available():
+        return False
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+
+class QuantizedScorer():
+    # reduced-precision copy of an MDNet for fc6 candidate scoring: dynamic int8 fc4-fc6,
+    # bf16 conv trunk where the CPU supports it. only the ranking of the scores matters there,
+    # features for training and bbreg keep coming from the fp32 model
+    def __init__(self, opts):
+        self.opts = opts
+        self.reset()
+
+    def reset(self, model=None):
+        opts = self.opts
+        enabled = opts.get('quantize', False) and not opts['use_gpu']
+        self.conv_precision = opts.get('quantize_conv', 'bf16')
+        # accuracy guard: every check_interval calls the fp32 top-k is compared with the quantized one
+        self.check_interval = opts.get('quantize_check', 50)
+        self.topk = opts.get('quantize_topk', 5)
+        self.min_agreement = opts.get('quantize_agreement', 0.8)
+        self.model = model if enabled else None
+        self.conv = None
+        self.head = None
+        self.bf16 = self.conv_precision == 'bf16' and bf16_supported()
+        self.calls = 0
+        self.agreement = []
+        self.disabled = False
+
+    def active(self, model):
+        return model is self.model and not self.disabled
+
+    def invalidate(self):
+        # re-quantize from the fp32 weights after train()
+        self.head = None
+        if self.model is not None and any(p.requires_grad for p in self.model.layers[:3].parameters()):
+            self.conv = None
+
+    def prepare(self):
+        if self.conv is None:
+            convs = [layer for name, layer in self.model.layers.named_children() if name.startswith('conv')]
+            self.conv = copy.deepcopy(nn.Sequential(*convs, nn.Flatten())).eval()
+        if self.head is None:
+            head = copy.deepcopy(nn.Sequential(*head_modules(self.model))).eval()
+            self.head = torch.quantization.quantize_dynamic(head, {nn.Linear}, dtype=torch.qint8)
+
+    def check(self, regions, scores):
+        # fraction of the fp32 top-k (by [:, 1]) that the quantized scores also rank top-k
+        k = min(self.topk, scores.size(0))
+        reference = self.model(regions, out_layer='fc6')
+        top = set(reference[:, 1].topk(k)[1].tolist())
+        agreement = len(top & set(scores[:, 1].topk(k)[1].tolist())) / float(k)
+        self.agreement.append(agreement)
+        if agreement < self.min_agreement:
+            self.disabled = True
+            print('quantized scoring disabled: top-{:d} agreement {:.2f}'.format(k, agreement))
+
+    def __call__(self, model, regions):
+        self.prepare()
+        with torch.no_grad():
+            if self.bf16:
+                with torch.autocast('cpu', dtype=torch.bfloat16):
+                    feat = self.conv(regions)
+                feat = feat.float()
+            else:
+                feat = self.conv(regions)
+            scores = self.head(feat)
+
+            if self.check_interval > 0 and self.calls % self.check_interval == 0:
+                self.check(regions, scores)
+        self.calls += 1
+        return scores
+
+    def summary(self):
+        if len(self.agreement) == 0:
+            return None
+        return {'checks': len(self.agreement), 'agreement': float(np.mean(self.agreement)),
+                'min_agreement': float(np.min(self.agreement)), 'disabled': self.disabled}
@@ -0,0 +1,63 @@
+import numpy as np
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+
+def dense_forward(model, feat_map):
+    # evaluate fc4-fc6 at every position of a conv3 map, each Linear applied as a convolution
+    layers = [module for name, module in model.layers.named_children() if name.startswith('fc')]
+    x = feat_map
+    for module in layers + [model.branches[0]]:
+        for m in module:
+            if isinstance(m, nn.Linear):
+                c = x.size(1)
+                k = int(round((m.in_features // c) ** 0.5))
+                x = F.conv2d(x, m.weight.view(m.out_features, c, k, k), m.bias)
+            else:
+                x = m(x)
+    return x
+
+
+class DenseRedetector():
+    def __init__(self, extractor, opts):
+        self.extractor = extractor
+        self.img_size = opts['img_size']
+        self.padding = opts['padding']
+        self.search_range = opts.get('redetect_range', 2.0)
+        self.n_peaks = opts.get('redetect_peaks', 5)
+
+    def search_window(self, bbox):
+        # boxes at the corners of the window, r target sizes around bbox
+        x, y, w, h = bbox
+        r = self.search_range
+        return np.array([[x - r * w, y - r * h, w, h],
+                         [x + r * w, y + r * h, w, h]])
+
+    def response(self, model, image, bbox):
+        self.extractor.ensure(model, image, self.search_window(bbox))
+        model.eval()
+        with torch.no_grad():
+            return dense_forward(model, self.extractor.feat_map)[0, 1]
+
+    def __call__(self, model, image, bbox):
+        # boxes at the strongest local maxima of the response map around bbox, with their scores
+        response = self.response(model, image, np.asarray(bbox, dtype='float64'))
+
+        pooled = F.max_pool2d(response[None, None], 3, stride=1, padding=1)[0, 0]
+        peaks = torch.where(response == pooled, response, torch.full_like(response, -float('inf')))
+        top_scores, top_idx = peaks.view(-1).topk(min(self.n_peaks, peaks.numel()))
+        top_idx = top_idx.cpu().numpy()
+        rows = top_idx // response.size(1)
+        cols = top_idx % response.size(1)
+
+        # a response cell is the img_size crop whose conv3 cells start at that position
+        ext = self.extractor
+        pw, ph = self.img_size / ext.map_scale
+        w = pw / (1 + 2. * self.padding / self.img_size)
+        h = ph / (1 + 2. * self.padding / self.img_size)
+        x = ext.region[0] + cols * ext.stride / ext.map_scale[0] + (pw - w) / 2
+        y = ext.region[1] + rows * ext.stride / ext.map_scale[1] + (ph - h) / 2
+        boxes = np.stack([x, y, np.full_like(x, w), np.full_like(y, h)], axis=1)
+        return boxes, top_scores
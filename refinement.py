@@ -0,0 +1,160 @@
+import time
+
+import numpy as np
+
+import torch
+
+from box_ops import edge_moves, neighbours
+
+
+class HillClimbing():
+    # unit-step hill climbing of all boxes in lockstep: one score_fn call per step for the
+    # neighbours of every active box. a box moves to its best neighbour while that scores higher
+    # than the box, so it stops at a local maximum (or on a plateau); opts['hill_max_steps'] limits
+    # the steps, 0 = unlimited
+    def __init__(self, opts):
+        self.opts = opts
+        self.reset()
+
+    def reset(self):
+        self.max_steps = self.opts.get('hill_max_steps', 0)
+        self.calls = 0
+        self.evals = 0
+
+    def __call__(self, score_fn, boxes, budget=None, max_steps=None, tracer=None):
+        # same interface as PatternSearch; the first step always runs, even out of frame budget
+        boxes = np.array(boxes, dtype='float32').reshape(-1, 4)
+        last_top_score = np.full(len(boxes), -np.inf, dtype='float32')
+        active = np.arange(len(boxes))
+        box_scores = None
+        max_steps = max_steps or self.max_steps
+        steps = 0
+        evals = 0
+
+        while len(active) > 0:
+            if max_steps > 0 and steps >= max_steps:
+                break
+            if box_scores is not None and budget is not None and not budget.allow('hill_climb_step'):
+                budget.degrade('hill_climbing')
+                break
+            tic = time.time()
+            if tracer is not None:
+                tracer.count('hill_climb_steps')
+            # neighbours of a box: move one of its edges by one pixel
+            candidates = neighbours(boxes[active], edge_moves)
+            scores = score_fn(candidates.reshape(-1, 4)).view(len(active), len(edge_moves), -1)
+            evals += candidates.shape[0] * candidates.shape[1]
+            steps += 1
+            top_score, top_index = scores[:, :, 1].max(1)
+            top_score = top_score.cpu().numpy()
+            top_index = top_index.cpu().numpy()
+
+            if box_scores is None:
+                box_scores = scores.new_empty((len(boxes), scores.size(2)))
+
+            # End of hill climbing: boxes whose best neighbour is no better are THE BEST!
+            moved = top_score > last_top_score[active]
+            boxes[active[moved]] = candidates[moved, top_index[moved]]
+            box_scores[torch.from_numpy(active[moved])] = scores[torch.from_numpy(np.nonzero(moved)[0]),
+                                                                 torch.from_numpy(top_index[moved])]
+            last_top_score[active[moved]] = top_score[moved]
+            active = active[moved]
+            if budget is not None:
+                budget.record('hill_climb_step', time.time() - tic)
+
+        self.calls += 1
+        self.evals += evals
+        return boxes, box_scores, evals
+
+
+class PatternSearch():
+    # batched pattern search over the 8 edge moves with steps relative to the box size.
+    # a box takes its best neighbour while that beats its score by more than tol, otherwise
+    # its step shrinks down to min_step pixels; it stops when no neighbour at min_step is better
+    # or after max_steps steps
+    def __init__(self, opts):
+        self.opts = opts
+        self.reset()
+
+    def reset(self):
+        self.step = self.opts.get('refine_step', 0.1)
+        self.shrink = self.opts.get('refine_shrink', 0.5)
+        self.min_step = self.opts.get('refine_min_step', 1.)
+        self.tol = self.opts.get('refine_tol', 1e-3)
+        self.max_steps = self.opts.get('refine_max_steps', 20)
+        self.calls = 0
+        self.evals = 0
+
+    def __call__(self, score_fn, boxes, budget=None, max_steps=None, tracer=None):
+        # score_fn(boxes (N, 4)) -> fc6 scores (N, 2); returns the refined boxes, their scores
+        # and the number of boxes scored. budget (a FrameBudget) can stop it early, tracer counts the steps
+        boxes = np.array(boxes, dtype='float32').reshape(-1, 4)
+        box_scores = score_fn(boxes).clone()
+        best = box_scores[:, 1].cpu().numpy()
+        evals = len(boxes)
+
+        # step per box for the x (left, width) and y (top, height) components of the moves
+        steps = np.maximum(boxes[:, 2:] * self.step, self.min_step)
+        active = np.arange(len(boxes))
+
+        # like hill climbing, no step limit of the caller (None or 0) leaves the engine's own
+        for _ in range(max_steps or self.max_steps):
+            if len(active) == 0:
+                break
+            if budget is not None and not budget.allow('hill_climb_step'):
+                budget.degrade('hill_climbing')
+                break
+            tic = time.time()
+            if tracer is not None:
+                tracer.count('pattern_steps')
+
+            # (N, 8, 4): the edge moves of every active box scaled by its own step,
+            # at most half the box so that a move never makes it empty
+            scale = np.tile(np.minimum(steps[active], boxes[active, 2:] / 2), 2)
+            candidates = boxes[active][:, None, :] + edge_moves[None] * scale[:, None, :]
+            scores = score_fn(candidates.reshape(-1, 4)).view(len(active), len(edge_moves), -1)
+            evals += candidates.shape[0] * candidates.shape[1]
+            top_score, top_index = scores[:, :, 1].max(1)
+            top_score = top_score.cpu().numpy()
+            top_index = top_index.cpu().numpy()
+
+            improved = top_score > best[active] + self.tol
+            moved = active[improved]
+            boxes[moved] = candidates[improved, top_index[improved]]
+            box_scores[torch.from_numpy(moved)] = scores[torch.from_numpy(np.nonzero(improved)[0]),
+                                                         torch.from_numpy(top_index[improved])]
+            best[moved] = top_score[improved]
+
+            # no better neighbour: search closer, down to min_step; a box that found none
+            # at min_step is at a local maximum
+            stuck = active[~improved]
+            done = stuck[steps[stuck].max(1) <= self.min_step]
+            steps[stuck] = np.maximum(steps[stuck] * self.shrink, self.min_step)
+            active = np.setdiff1d(active, done)
+
+            if budget is not None:
+                budget.record('hill_climb_step', time.time() - tic)
+
+        self.calls += 1
+        self.evals += evals
+        return boxes, box_scores, evals
+
+
+# engines selectable with opts['refine']
+refiners = {'hill': HillClimbing, 'pattern': PatternSearch}
+
+
+class Refiner():
+    # the refinement engine of a run; enabled when it is not the default hill climbing
+    def __init__(self, opts):
+        self.opts = opts
+        self.reset()
+
+    def reset(self):
+        name = self.opts.get('refine', 'hill')
+        assert name in refiners
+        self.engine = refiners[name](self.opts)
+        self.enabled = name != 'hill'
+
+    def __call__(self, score_fn, boxes, budget=None, max_steps=None, tracer=None):
+        return self.engine(score_fn, boxes, budget, max_steps, tracer)
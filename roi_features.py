@@ -0,0 +1,123 @@
+import numpy as np
+from PIL import Image
+
+import torch
+from torchvision.ops import roi_align
+
+
+def conv_forward(model, x, out_layer='conv3'):
+    # run the conv trunk only, keeping the spatial layout of the feature map
+    for name, module in model.layers.named_children():
+        x = module(x)
+        if name == out_layer:
+            return x
+
+
+class RoIFeatureExtractor():
+    def __init__(self, opts):
+        self.img_size = opts['img_size']
+        self.padding = opts['padding']
+        self.use_gpu = opts['use_gpu']
+
+        # geometry of the conv3 cells inside an img_size crop
+        self.stride = opts.get('roi_stride', 16)
+        self.offset = opts.get('roi_offset', 37)
+        self.output_size = opts.get('roi_output_size', 3)
+        self.sampling_ratio = opts.get('roi_sampling_ratio', 1)
+        self.max_size = opts.get('roi_max_size', 1024)
+
+        self.reset()
+
+    def reset(self):
+        self.image = None
+        self.region = None
+        self.feat_map = None
+        self.scale = None
+
+    def padded(self, samples):
+        samples = np.asarray(samples, dtype='float32').reshape(-1, 4)
+        pad = 1 + 2. * self.padding / self.img_size
+        w = samples[:, 2] * pad
+        h = samples[:, 3] * pad
+        x = samples[:, 0] + samples[:, 2] / 2 - w / 2
+        y = samples[:, 1] + samples[:, 3] / 2 - h / 2
+        return np.stack([x, y, w, h], axis=1)
+
+    def set_frame(self, image, samples):
+        # the target scale is fixed by the first boxes seen on a frame
+        self.reset()
+        self.image = image
+        padded = self.padded(samples)
+        ref_w = max(np.median(padded[:, 2]), 1.)
+        ref_h = max(np.median(padded[:, 3]), 1.)
+        self.scale = np.array([self.img_size / ref_w, self.img_size / ref_h])
+
+    def ensure(self, model, image, samples):
+        if image is not self.image:
+            self.set_frame(image, samples)
+
+        padded = self.padded(samples)
+        region = np.array([padded[:, 0].min(), padded[:, 1].min(),
+                           (padded[:, 0] + padded[:, 2]).max(), (padded[:, 1] + padded[:, 3]).max()])
+        if self.region is not None:
+            if region[0] >= self.region[0] and region[1] >= self.region[1] and \
+               region[2] <= self.region[2] and region[3] <= self.region[3]:
+                return
+            region = np.concatenate([np.minimum(region[:2], self.region[:2]),
+                                     np.maximum(region[2:], self.region[2:])])
+        self.compute(model, region)
+
+    def compute(self, model, region):
+        # keep the crop at least one img_size wide so conv3 is not empty
+        # (grown symmetrically, so a region that is large enough stays exactly as given and
+        # boxes on its border are still found inside it by ensure())
+        min_size = self.img_size / self.scale
+        grow = np.maximum(min_size - (region[2:] - region[:2]), 0) / 2
+        region = np.concatenate([region[:2] - grow, region[2:] + grow])
+        size = region[2:] - region[:2]
+
+        out_size = size * self.scale
+        if out_size.max() > self.max_size:
+            self.scale = self.scale * self.max_size / out_size.max()
+            out_size = size * self.scale
+        out_size = np.maximum(np.round(out_size), self.img_size).astype(int)
+
+        patch = self.image.transform(tuple(out_size), Image.EXTENT, tuple(region),
+                                     Image.BILINEAR, fillcolor=(128, 128, 128))
+        patch = np.asarray(patch, dtype='float32').transpose(2, 0, 1) - 128.
+        patch = torch.from_numpy(np.ascontiguousarray(patch))[None]
+        if self.use_gpu:
+            patch = patch.cuda()
+
+        with torch.no_grad():
+            self.feat_map = conv_forward(model, patch)
+        self.region = region
+        # effective scale after rounding to whole pixels
+        self.map_scale = out_size / size
+
+    def rois(self, samples):
+        # boxes in map pixels, shifted so that roi_align bins land on conv3 cell centers
+        padded = self.padded(samples)
+        k = self.output_size
+        lo = (self.offset - self.stride / 2.) / self.img_size
+        hi = (self.offset + self.stride * (k - 0.5)) / self.img_size
+        x1 = (padded[:, 0] + lo * padded[:, 2] - self.region[0]) * self.map_scale[0]
+        y1 = (padded[:, 1] + lo * padded[:, 3] - self.region[1]) * self.map_scale[1]
+        x2 = (padded[:, 0] + hi * padded[:, 2] - self.region[0]) * self.map_scale[0]
+        y2 = (padded[:, 1] + hi * padded[:, 3] - self.region[1]) * self.map_scale[1]
+        shift = self.offset - self.stride / 2.
+        rois = np.stack([np.zeros_like(x1), x1 - shift, y1 - shift, x2 - shift, y2 - shift], axis=1)
+        return torch.from_numpy(rois.astype('float32')).to(self.feat_map.device)
+
+    def pool(self, model, image, samples):
+        self.ensure(model, image, samples)
+        feats = roi_align(self.feat_map, self.rois(samples), self.output_size,
+                          spatial_scale=1. / self.stride, sampling_ratio=self.sampling_ratio, aligned=True)
+        return feats.view(feats.size(0), -1)
+
+    def __call__(self, model, image, samples, out_layer='conv3'):
+        feats = self.pool(model, image, samples)
+        if out_layer == 'conv3':
+            return feats
+        with torch.no_grad():
+            return model(feats, in_layer='fc4', out_layer=out_layer)
@@ -0,0 +1,117 @@
+import numpy as np
+import os
+import sys
+import copy
+import argparse
+import importlib
+import json
+import multiprocessing as mp
+
+import torch
+
+sys.path.insert(0, '.')
+from gen_config import gen_config
+
+default_models = {'000': 'models/model000.pth', '002': 'models/model001.pth', '003': 'models/model001.pth'}
+
+# per-worker state, set once by init_worker
+tracker = None
+base_model = None
+model_path = None
+
+
+def init_worker(tracker_id, path, n_threads):
+    global tracker, base_model, model_path
+    torch.set_num_threads(n_threads)
+    tracker = importlib.import_module('gpu_tracker' + tracker_id)
+    model_path = path
+    base_model = tracker.load_model(model_path)
+
+
+def track_sequence(item):
+    np.random.seed(0)
+    torch.manual_seed(0)
+
+    # sequence name or json config, as with -s/-j of the trackers
+    is_json = item.endswith('.json')
+    args = argparse.Namespace(seq='' if is_json else item, json=item if is_json else '',
+                              savefig=False, display=False)
+    img_list, init_bbox, gt, savefig_dir, display, result_path = gen_config(args)
+
+    result, result_bb, fps, overlap = tracker.run_mdnet(img_list, init_bbox, gt=gt, savefig_dir=savefig_dir,
+                                                        display=display, model_path=model_path,
+                                                        model=copy.deepcopy(base_model))
+
+    # Save result
+    res = {}
+    res['res'] = result_bb.round().tolist()
+    res['type'] = 'rect'
+    res['fps'] = fps
+    json.dump(res, open(result_path, 'w'), indent=2)
+
+    iou = float(overlap.mean()) if gt is not None else None
+    return item, iou, fps
+
+
+def list_sequences(args):
+    items = list(args.seq)
+    if args.list != '':
+        with open(args.list) as f:
+            items += [line.strip() for line in f if line.strip() != '']
+    if args.dir != '':
+        # json configs in the directory, or one sequence per subdirectory
+        for name in sorted(os.listdir(args.dir)):
+            path = os.path.join(args.dir, name)
+            if name.endswith('.json'):
+                items.append(path)
+            elif os.path.isdir(path):
+                items.append(name)
+    return items
+
+
+def main(args):
+    items = list_sequences(args)
+    assert len(items) > 0
+
+    workers = min(args.workers, len(items))
+    n_threads = max(1, (os.cpu_count() or 1) // workers)
+    model_path = args.model if args.model != '' else default_models[args.tracker]
+    print('tracker{:s}: {:d} sequences, {:d} workers x {:d} threads'.format(args.tracker, len(items), workers, n_threads))
+
+    sequences = {}
+    ctx = mp.get_context('spawn')
+    with ctx.Pool(workers, initializer=init_worker, initargs=(args.tracker, model_path, n_threads)) as pool:
+        for item, iou, fps in pool.imap_unordered(track_sequence, items):
+            sequences[item] = {'meanIOU': iou, 'fps': fps}
+            print('{:s}: meanIOU {:s}, fps {:.3f}'.format(item, 'n/a' if iou is None else '{:.3f}'.format(iou), fps))
+
+    ious = [v['meanIOU'] for v in sequences.values() if v['meanIOU'] is not None]
+    fpss = [v['fps'] for v in sequences.values()]
+    res = {}
+    res['tracker'] = 'tracker' + args.tracker
+    res['model'] = model_path
+    res['sequences'] = sequences
+    res['meanIOU'] = float(np.mean(ious)) if len(ious) > 0 else None
+    res['fps'] = float(np.mean(fpss))
+
+    output = args.output if args.output != '' else os.path.join('results', 'batch_tracker{:s}.json'.format(args.tracker))
+    if os.path.dirname(output) != '' and not os.path.exists(os.path.dirname(output)):
+        os.makedirs(os.path.dirname(output))
+    json.dump(res, open(output, 'w'), indent=2)
+    print('meanIOU: {:s}, fps: {:.3f}'.format('n/a' if res['meanIOU'] is None else '{:.3f}'.format(res['meanIOU']), res['fps']))
+    return res
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-t', '--tracker', default='003', choices=sorted(default_models.keys()))
+    parser.add_argument('-s', '--seq', nargs='*', default=[], help='input seqs or json configs')
+    parser.add_argument('-l', '--list', default='', help='file with one seq or json config per line')
+    parser.add_argument('-d', '--dir', default='', help='directory of seqs or json configs')
+    parser.add_argument('-w', '--workers', type=int, default=max(1, (os.cpu_count() or 1) // 4))
+    parser.add_argument('-m', '--model', default='')
+    parser.add_argument('-o', '--output', default='', help='aggregate result json')
+
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,34 @@
+import numpy as np
+
+import torch
+
+
+class SampleSet():
+    # candidate boxes paired with their fc6 scores, kept in sync by updating changed rows only
+    def __init__(self, boxes, scores):
+        self.boxes = np.array(boxes).reshape(-1, 4)
+        self.scores = scores
+        assert len(self.boxes) == self.scores.size(0)
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def index(self, idx):
+        return torch.as_tensor(np.asarray(idx), dtype=torch.long).to(self.scores.device)
+
+    def patch(self, idx, boxes, scores):
+        self.boxes[idx] = boxes
+        self.scores[self.index(idx)] = scores
+
+    def append(self, boxes, scores):
+        self.boxes = np.concatenate((self.boxes, np.asarray(boxes).reshape(-1, 4)))
+        self.scores = torch.cat((self.scores, scores), 0)
+
+    def take(self, idx):
+        return self.boxes[idx], self.scores[self.index(idx)]
+
+    def topk(self, k=5):
+        return self.scores[:, 1].topk(min(k, len(self)))
+
+    def copy(self):
+        return SampleSet(self.boxes.copy(), self.scores.clone())
@@ -0,0 +1,67 @@
+import numpy as np
+
+import torch
+
+
+class ScoreCache():
+    def __init__(self, quantum=0.01):
+        self.quantum = quantum
+        self.reset()
+
+    def reset(self):
+        self.hits = 0
+        self.misses = 0
+        self.clear()
+
+    def clear(self):
+        self.image = None
+        self.table = {}
+        self.scores = None
+        self.size = 0
+
+    def invalidate(self):
+        # weights changed: every cached score belongs to an old model version
+        image = self.image
+        self.clear()
+        self.image = image
+
+    def keys(self, samples):
+        q = np.round(np.asarray(samples, dtype='float64').reshape(-1, 4) / self.quantum).astype(np.int64)
+        return [tuple(k) for k in q.tolist()]
+
+    def store(self, keys, scores):
+        n = len(keys)
+        if self.scores is None:
+            self.scores = scores.new_empty((max(n, 256), scores.size(1)))
+        elif self.size + n > self.scores.size(0):
+            grown = self.scores.new_empty((max(self.size + n, 2 * self.scores.size(0)), self.scores.size(1)))
+            grown[:self.size] = self.scores[:self.size]
+            self.scores = grown
+
+        self.scores[self.size:self.size + n] = scores
+        for j, k in enumerate(keys):
+            self.table[k] = self.size + j
+        self.size += n
+
+    def __call__(self, image, samples, score_fn):
+        # scores are scoped to the current frame
+        if image is not self.image:
+            self.clear()
+            self.image = image
+
+        samples = np.asarray(samples).reshape(-1, 4)
+        keys = self.keys(samples)
+
+        uncached = {}
+        for j, k in enumerate(keys):
+            if k not in self.table and k not in uncached:
+                uncached[k] = j
+        self.misses += len(uncached)
+        self.hits += len(keys) - len(uncached)
+
+        if len(uncached) > 0:
+            scores = score_fn(samples[list(uncached.values())])
+            self.store(list(uncached.keys()), scores)
+
+        rows = torch.as_tensor([self.table[k] for k in keys], dtype=torch.long)
+        return self.scores[rows.to(self.scores.device)]
@@ -0,0 +1,138 @@
+import json
+import os
+import time
+
+import numpy as np
+
+import torch
+
+
+class NullSpan():
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+null_span = NullSpan()
+
+
+class Span():
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        if self.tracer.sync:
+            torch.cuda.synchronize()
+        self.tic = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.tracer.sync:
+            torch.cuda.synchronize()
+        self.tracer.add(self.name, time.perf_counter() - self.tic)
+        return False
+
+
+class Tracer():
+    # named spans and counters per frame; every call is a no-op until start()
+    def __init__(self):
+        self.enabled = False
+        self.sync = False
+        self.file = None
+        self.path = ''
+        self.frames = []
+        self.spans = {}
+        self.counters = {}
+
+    def start(self, path='', sync=False):
+        # path '' keeps the frames in memory only; sync waits for the GPU around every span
+        self.stop()
+        self.enabled = True
+        self.sync = sync and torch.cuda.is_available()
+        self.path = path
+        self.file = open(path, 'w') if path != '' else None
+        self.frames = []
+        self.spans = {}
+        self.counters = {}
+
+    def stop(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.enabled = False
+
+    def span(self, name):
+        if not self.enabled:
+            return null_span
+        return Span(self, name)
+
+    def iterate(self, name, iterable):
+        # time spent producing each item of iterable, e.g. region cropping in RegionExtractor
+        if not self.enabled:
+            return iterable
+        return self.timed(name, iterable)
+
+    def timed(self, name, iterable):
+        it = iter(iterable)
+        while True:
+            tic = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                self.add(name, time.perf_counter() - tic)
+                return
+            self.add(name, time.perf_counter() - tic)
+            yield item
+
+    def add(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0.) + seconds
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def end_frame(self, i, spf):
+        if not self.enabled:
+            return
+        frame = {'frame': i, 'time': spf * 1000.,
+                 'spans': {k: v * 1000. for k, v in self.spans.items()},
+                 'counters': self.counters}
+        self.frames.append(frame)
+        if self.file is not None:
+            self.file.write(json.dumps(frame) + '\n')
+        self.spans = {}
+        self.counters = {}
+
+    def summary(self):
+        # p50/p95/p99 of the per-frame time of each span (ms), totals of the counters
+        # frame 0 (initialisation) is left out unless it is the only one
+        frames = self.frames[1:] if len(self.frames) > 1 else self.frames
+        names = sorted(set(k for f in frames for k in f['spans']))
+        res = {'frames': len(frames), 'spans': {}, 'counters': {}}
+        for name in ['time'] + names:
+            values = [f['time'] if name == 'time' else f['spans'].get(name, 0.) for f in frames]
+            res['spans'][name] = {'p50': float(np.percentile(values, 50)),
+                                  'p95': float(np.percentile(values, 95)),
+                                  'p99': float(np.percentile(values, 99)),
+                                  'total': float(np.sum(values))}
+        for f in self.frames:
+            for k, v in f['counters'].items():
+                res['counters'][k] = res['counters'].get(k, 0) + v
+        return res
+
+    def report(self):
+        # print the summary and write it next to the trace
+        if not self.enabled or len(self.frames) == 0:
+            return None
+        res = self.summary()
+        print('{:<16s} {:>9s} {:>9s} {:>9s}'.format('span (ms)', 'p50', 'p95', 'p99'))
+        for name, v in res['spans'].items():
+            print('{:<16s} {:9.2f} {:9.2f} {:9.2f}'.format(name, v['p50'], v['p95'], v['p99']))
+        for name, v in sorted(res['counters'].items()):
+            print('{:<16s} {:9d}'.format(name, v))
+        if self.path != '':
+            json.dump(res, open(os.path.splitext(self.path)[0] + '_summary.json', 'w'), indent=2)
+        return res
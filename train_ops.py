@@ -0,0 +1,8 @@
+import torch
+
+
+def index_schedule(n, batch, maxiter):
+    # (maxiter, batch) indices into n rows, taken from back-to-back random permutations
+    # of range(n) like the old concatenate loop, but drawn in one shot
+    n_perm = -(-batch * maxiter // n)
+    return torch.rand(n_perm, n).argsort(1).view(-1)[:batch * maxiter].view(maxiter, batch)
@@ -0,0 +1,92 @@
+import math
+
+import torch.nn.functional as F
+
+
+class UpdateScheduler():
+    # decides when track() runs an online update and with how many iterations.
+    # fixed policy (default): maxiter_update on failure and every long_interval frames.
+    # adaptive (opts['adaptive_update']): successful frames update when the top 5 score or its margin
+    # over the other candidates dropped, or when the target looks new to the pos memory, within a
+    # compute budget of opts['update_budget'] iterations per frame; failures always update
+    def __init__(self, opts):
+        self.opts = opts
+        self.reset()
+
+    def reset(self):
+        opts = self.opts
+        self.adaptive = opts.get('adaptive_update', False)
+        self.maxiter = opts['maxiter_update']
+        self.long_interval = opts['long_interval']
+        self.threshold = opts.get('update_threshold', 0.3)
+        self.novelty_scale = opts.get('update_novelty', 0.05)
+        self.min_interval = opts.get('update_min_interval', 2)
+        self.max_interval = opts.get('update_max_interval', 3 * self.long_interval)
+        self.momentum = opts.get('update_momentum', 0.9)
+        self.budget = opts.get('update_budget', 0.5 * self.maxiter / self.long_interval)
+        self.burst = opts.get('update_burst', 2 * self.maxiter)
+
+        self.credit = self.burst
+        self.score_mean = None
+        self.margin_mean = None
+        self.pos_mean = None
+        self.last_novelty = 0.
+        self.last_update = 0
+        self.updates = 0
+        self.iters = 0
+
+    def novelty(self, pos_feats):
+        # cosine distance of this frame's pos features from the running mean of the earlier ones
+        mean = pos_feats.mean(0)
+        if self.pos_mean is None:
+            self.pos_mean = mean
+            self.last_novelty = 0.
+        else:
+            self.last_novelty = 1 - F.cosine_similarity(mean, self.pos_mean, dim=0).item()
+            self.pos_mean = self.momentum * self.pos_mean + (1 - self.momentum) * mean
+        return self.last_novelty
+
+    def drop(self, value, mean):
+        # relative drop of value below its running mean, 0 when it did not drop
+        if mean is None or mean <= 0:
+            return 0.
+        return max(0., 1 - value / mean)
+
+    def iterations(self, i, success, target_score, scores):
+        # update iterations for frame i (0 = no update); scores are the fc6 [:, 1] scores of the candidates
+        if not self.adaptive:
+            if not success or i % self.long_interval == 0:
+                return self.maxiter
+            return 0
+
+        self.credit = min(self.burst, self.credit + self.budget)
+        if not success:
+            return self.maxiter
+
+        score = float(target_score)
+        margin = score - float(scores.median())
+        urgency = max(self.drop(score, self.score_mean), self.drop(margin, self.margin_mean),
+                      self.last_novelty / self.novelty_scale)
+        self.score_mean = score if self.score_mean is None else \
+            self.momentum * self.score_mean + (1 - self.momentum) * score
+        self.margin_mean = margin if self.margin_mean is None else \
+            self.momentum * self.margin_mean + (1 - self.momentum) * margin
+
+        since = i - self.last_update
+        if since < self.min_interval:
+            return 0
+        # without any trigger the model is still refreshed every max_interval frames
+        if since >= self.max_interval:
+            urgency = max(urgency, 1.)
+        if urgency < self.threshold:
+            return 0
+        return int(min(self.credit, math.ceil(self.maxiter * min(1., urgency))))
+
+    def done(self, i, maxiter):
+        self.credit -= maxiter
+        self.last_update = i
+        self.updates += 1
+        self.iters += maxiter
+
+    def summary(self):
+        return {'updates': self.updates, 'iterations': self.iters}
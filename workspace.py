@@ -0,0 +1,17 @@
+class Workspace():
+    # output buffers per layer, sized from the sample count and reused across calls
+    def __init__(self):
+        self.buffers = {}
+
+    def clear(self):
+        self.buffers = {}
+
+    def get(self, name, n, like):
+        # buffer with room for n rows shaped like `like`; it is only valid until the next get() for `name`
+        shape = tuple(like.shape[1:])
+        buf = self.buffers.get(name)
+        if buf is None or buf.size(0) < n or tuple(buf.shape[1:]) != shape or \
+           buf.dtype != like.dtype or buf.device != like.device:
+            buf = like.new_empty((n,) + shape)
+            self.buffers[name] = buf
+        return buf[:n]